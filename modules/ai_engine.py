@@ -1,60 +1,118 @@
-import streamlit as st
-from groq import Groq
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from modules.llm_dispatcher import get_llm_dispatcher
+from modules.response_cache import get_response_cache, scope_key
+from modules.prompt_builder import build_prompt, prior_turns
+from modules.retrieval import get_rag_index
+from modules.regime_index import get_regime_index
 
-@st.cache_resource
 def setup_rag_vector_db(df):
-    """Optimized: Shortens context strings to save tokens and prevent lag."""
-    df['rag_context'] = df.apply(lambda x: (
-        f"{x['Date'].strftime('%m/%y')}: WTI=${x['WTI']:.1f}, Vol={x['Volatility']:.2f}, CP={x['Crisis_Prob']:.2f}"
-    ), axis=1)
-    
-    vectorizer = TfidfVectorizer(stop_words='english')
-    tfidf_matrix = vectorizer.fit_transform(df['rag_context'].fillna(""))
-    return vectorizer, tfidf_matrix, df
-
-def get_ai_response(user_query, vectorizer, tfidf_matrix, df):
-    """Securely communicates with Groq using the latest Llama 3.3 model with expanded memory."""
+    """Optimized: Shortens context strings to save tokens and prevent lag.
+
+    The TF-IDF index is loaded from the shared on-disk cache (fitted once per data
+    version). Returns the RetrievalIndex, to pass to get_ai_response / stream_ai_response,
+    and a new frame with a rag_context column; the caller's frame is left untouched.
+    """
+    index = get_rag_index(df, 'compact')
+    return index, df.assign(rag_context=index.contexts)
+
+def live_data_context(df):
+    """The LIVE_DATA line: absolute latest row of the CSV, plus the regime history from the regime index."""
+    latest = df.loc[df['Date'].idxmax()]
+    return f"CURRENT_STATE: {latest['Date'].strftime('%Y-%m-%d')} | WTI: ${latest['WTI']:.2f} | Volatility Sigma: {latest['Volatility']:.3f} | Crisis Prob: {latest['Crisis_Prob']:.2f}" + regime_history_context(df)
+
+def regime_history_context(df):
+    """' | Regime: CALM since 2020-10 | Last crisis: 2020-03..2020-08 (63 months ago)' from the shared regime index."""
+    index = get_regime_index(df)
+    if not index.n_rows:
+        return ""
+    current = index.segments(index.last_date, index.last_date).iloc[-1]
+    text = f" | Regime: {current['regime']} since {current['start'].strftime('%Y-%m')}"
+    crisis = index.last_crisis()
+    if crisis is None:
+        return text + " | Last crisis: none on record"
+    if current['regime'] == 'CRISIS':
+        return text
+    return text + f" | Last crisis: {crisis['start'].strftime('%Y-%m')}..{crisis['end'].strftime('%Y-%m')} ({index.months_since_last_crisis()} months ago)"
+
+DAEMON_SYSTEM_PROMPT = (
+    "You are OVIP, an elite tactical oil analyst and risk intelligence daemon. "
+    "Tone: Professional, cold, analytical, and tactical. "
+    "MANDATE: You must synthesize the hypothetical user queries with the actual LIVE SYSTEM DATA. "
+    "Example: If asked about war, compare the 'what-if' to the current Volatility Sigma and Crisis Prob. "
+    "RETRIEVED_HISTORY lists the most relevant past months as 'MM/YY: WTI=$price, Vol=volatility, CP=crisis probability'. "
+    "Always use clear tactical headers: [EXECUTIVE SUMMARY], [MARKET THREAT LEVEL], [OPERATIONAL STRATEGY]. "
+    "Define 'NPRS-1' as the 69% accuracy directional ML model if conceptually relevant."
+)
+
+def build_daemon_messages(user_query, df, history=None, index=None):
+    """Chat messages for the OVIP daemon, assembled under the prompt token budget.
+
+    LIVE_DATA comes from the latest row, RETRIEVED_HISTORY from the top-k months of the RAG
+    index, and CHAT_LOGS keeps the latest turns verbatim with older turns condensed.
+    """
+    return build_prompt(DAEMON_SYSTEM_PROMPT, live_data_context(df), user_query, history, index).messages
+
+def response_scope(index, df, user_query="", history=None):
+    """Response cache scope: the retrieval index version, the LIVE_DATA snapshot and the chat turns the answer is built on.
+
+    The index version already identifies the data (it is the hash the index was loaded by),
+    so nothing is re-hashed per message.
+    """
+    turns = "\x1e".join(f"{m['role']}:{m['content']}" for m in prior_turns(user_query, history))
+    return scope_key(index.version, live_data_context(df), turns)
+
+# Groq generation settings with high-capacity token limit
+DAEMON_PARAMS = {
+    'temperature': 0.2,  # Keeps it very factual/analytical
+    'max_tokens': 1000,  # Increased to prevent response cutoff
+}
+
+def get_ai_response(user_query, index, df, history=None, backend=None, priority='chat'):
+    """Securely communicates with Groq using the latest Llama 3.3 model with expanded memory.
+
+    index is the RetrievalIndex from setup_rag_vector_db, searched for RETRIEVED_HISTORY.
+
+    history is the chat log as a list of {'role', 'content'} dicts (e.g. st.session_state.chat).
+    backend selects the LLM gateway backend (defaults to OVIP_LLM_BACKEND, else groq) and
+    priority the dispatcher lane ('dashboard' summaries are served before 'chat').
+    Repeated or paraphrased questions against the same data, LIVE_DATA and chat turns are
+    answered from the response cache (matched on the questions' own wording) without calling the model.
+    """
     try:
-        # Initialize Groq client
-        client = Groq(api_key=st.secrets['GROQ_API_KEY'])
-        
-        # 1. Grab absolute latest data from the CSV
-        df_sorted = df.sort_values('Date')
-        latest = df_sorted.iloc[-1]
-        latest_context = f"CURRENT_STATE: {latest['Date'].strftime('%Y-%m-%d')} | WTI: ${latest['WTI']:.2f} | Volatility Sigma: {latest['Volatility']:.3f} | Crisis Prob: {latest['Crisis_Prob']:.2f}"
-        
-        # 2. Extract Chat Memory
-        history_text = ""
-        if 'chat' in st.session_state:
-            # We take the last 6 messages to maintain deep context
-            for msg in st.session_state.chat[-6:]:
-                role = "USER" if msg['role'] == 'user' else "OVIP_DAEMON"
-                history_text += f"{role}: {msg['content']}\n"
-
-        # 3. Call Groq with high-capacity token limit
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {
-                    "role": "system", 
-                    "content": (
-                        "You are OVIP, an elite tactical oil analyst and risk intelligence daemon. "
-                        "Tone: Professional, cold, analytical, and tactical. "
-                        "MANDATE: You must synthesize the hypothetical user queries with the actual LIVE SYSTEM DATA. "
-                        "Example: If asked about war, compare the 'what-if' to the current Volatility Sigma and Crisis Prob. "
-                        "Always use clear tactical headers: [EXECUTIVE SUMMARY], [MARKET THREAT LEVEL], [OPERATIONAL STRATEGY]. "
-                        "Define 'NPRS-1' as the 69% accuracy directional ML model if conceptually relevant."
-                    )
-                },
-                {"role": "user", "content": f"LIVE_DATA: {latest_context}\n\nCHAT_LOGS:\n{history_text}\n\nUSER_COMMAND: {user_query}"}
-            ],
-            temperature=0.2, # Keeps it very factual/analytical
-            max_tokens=1000  # Increased to prevent response cutoff
-        )
-        
-        return response.choices[0].message.content
+        cache = get_response_cache()
+        scope = response_scope(index, df, user_query, history)
+        cached = cache.get(user_query, scope)
+        if cached is not None:
+            return cached
+
+        # Shared pooled client behind the dispatcher: bounded concurrency, rate limited, coalesced
+        messages = build_daemon_messages(user_query, df, history, index)
+        result = get_llm_dispatcher().complete(messages, backend=backend, priority=priority, **DAEMON_PARAMS)
+        cache.put(user_query, scope, result.text)
+        return result.text
         
     except Exception as e:
         return f"⚠️ SYSTEM_FAULT: {str(e)}"
+
+def stream_ai_response(user_query, index, df, history=None, backend=None, priority='chat'):
+    """Streaming variant of get_ai_response: yields completion tokens as the model produces them.
+
+    Failures are yielded as a SYSTEM_FAULT line, so the terminal always gets text.
+    Cached answers are yielded whole; completed streams are added to the cache.
+    """
+    try:
+        cache = get_response_cache()
+        scope = response_scope(index, df, user_query, history)
+        cached = cache.get(user_query, scope)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        messages = build_daemon_messages(user_query, df, history, index)
+        for token in get_llm_dispatcher().stream(messages, backend=backend, priority=priority, **DAEMON_PARAMS):
+            parts.append(token)
+            yield token
+        cache.put(user_query, scope, "".join(parts))
+        
+    except Exception as e:
+        yield f"\n⚠️ SYSTEM_FAULT: {str(e)}"
@@ -0,0 +1,341 @@
+"""
+OVIP - Backtesting Module
+Walk-forward revalidation of the NPRS-1 direction classifier and the RF-11
+level regressor. The test period is split into consecutive blocks (quarters by
+default); for each block the models are retrained on the data before it
+(expanding window, or a rolling window of fixed length) with the production
+hyperparameters and scored on the block. Fold feature matrices are built with
+a FeatureEngineer whose train_cutoff is the fold start, imputed with the
+training-window medians and cached on disk, and folds are fitted in parallel
+across a process pool.
+
+Per-fold metrics (directional accuracy, test and out-of-sample R², and the
+Clark-West test of RF-11 against the historical-mean forecast) are written to a
+compact CSV, with pooled rows over all folds.
+"""
+
+import os
+import math
+import time
+import pickle
+import hashlib
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+
+from modules.data_cache import default_cache_dir
+from modules.feature_engineering import FeatureEngineer
+from modules.model_registry import DEFAULT_MODELS_DIR, FeatureImputer
+from modules.models import ForestEvaluator, ModelPredictor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_START = '2021-01-01'
+DEFAULT_STEP_MONTHS = 3
+
+# Target column per model
+TARGETS = {'nprs1': 'Vol_Direction', 'rf11': 'Volatility'}
+
+METRIC_COLUMNS = [
+    'fold', 'model', 'train_start', 'test_start', 'test_end', 'n_train', 'n_test',
+    'accuracy', 'r2', 'oos_r2', 'cw_stat', 'cw_pvalue', 'fit_seconds',
+]
+
+
+@dataclass(frozen=True)
+class Fold:
+    """One walk-forward step: train on [train_start, test_start), test on [test_start, test_end)"""
+    index: int
+    train_start: pd.Timestamp
+    test_start: pd.Timestamp
+    test_end: pd.Timestamp
+
+
+def make_folds(
+    dates: pd.Series,
+    start: str = DEFAULT_START,
+    step_months: int = DEFAULT_STEP_MONTHS,
+    window_months: Optional[int] = None
+) -> List[Fold]:
+    """
+    Consecutive test blocks from start to the last date
+
+    Args:
+        dates: Observation dates
+        start: First test date
+        step_months: Length of each test block (3 = quarterly revalidation)
+        window_months: Rolling training window length (None = expanding window)
+
+    Returns:
+        List of folds in time order
+    """
+    first, last = dates.min(), dates.max()
+    folds = []
+    test_start = pd.Timestamp(start)
+    while test_start <= last:
+        test_end = test_start + pd.DateOffset(months=step_months)
+        train_start = first if window_months is None else max(first, test_start - pd.DateOffset(months=window_months))
+        folds.append(Fold(len(folds), train_start, test_start, test_end))
+        test_start = test_end
+    return folds
+
+
+def clark_west(y: np.ndarray, benchmark: np.ndarray, forecast: np.ndarray) -> Tuple[float, float]:
+    """
+    Clark-West test of a forecast against a nested benchmark forecast
+
+    Adjusted MSPE difference f = (y - b)^2 - [(y - m)^2 - (b - m)^2]; the
+    statistic is the t-ratio of its mean, tested one-sided (model better).
+
+    Returns:
+        Tuple of (statistic, p-value); NaN with fewer than two observations
+    """
+    f = (y - benchmark) ** 2 - ((y - forecast) ** 2 - (benchmark - forecast) ** 2)
+    n = len(f)
+    if n < 2:
+        return float('nan'), float('nan')
+    se = f.std(ddof=1) / math.sqrt(n)
+    if se == 0:
+        return float('nan'), float('nan')
+    stat = float(f.mean() / se)
+    return stat, 0.5 * math.erfc(stat / math.sqrt(2))
+
+
+def score_predictions(
+    model_name: str,
+    y: np.ndarray,
+    prediction: np.ndarray,
+    benchmark: np.ndarray
+) -> Dict[str, float]:
+    """Metrics of one model's test predictions (benchmark = training-mean forecast)"""
+    metrics = dict.fromkeys(['accuracy', 'r2', 'oos_r2', 'cw_stat', 'cw_pvalue'], float('nan'))
+    if len(y) == 0:
+        return metrics
+    if TARGETS[model_name] == 'Vol_Direction':
+        metrics['accuracy'] = float(np.mean(prediction == y))
+        return metrics
+
+    sse = float(np.sum((y - prediction) ** 2))
+    sst = float(np.sum((y - y.mean()) ** 2))
+    sse_benchmark = float(np.sum((y - benchmark) ** 2))
+    metrics['r2'] = 1 - sse / sst if sst > 0 else float('nan')
+    metrics['oos_r2'] = 1 - sse / sse_benchmark if sse_benchmark > 0 else float('nan')
+    metrics['cw_stat'], metrics['cw_pvalue'] = clark_west(y, benchmark, prediction)
+    return metrics
+
+
+def _fit_fold(task: Dict) -> Dict:
+    """Fit one model on one fold's cached matrices and predict the test block (runs in a worker)"""
+    with np.load(task['matrix_path']) as data:
+        columns = list(data['columns'])
+        idx = [columns.index(f) for f in task['features']]
+        X_train, X_test = data['X_train'][:, idx], data['X_test'][:, idx]
+        y_train = data[f"y_train_{task['model']}"]
+        y_test = data[f"y_test_{task['model']}"]
+
+    start = time.perf_counter()
+    estimator = task['estimator'].fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    prediction = ForestEvaluator(estimator).predict(X_test) if len(X_test) else np.empty(0)
+    return {
+        'fold': task['fold'],
+        'model': task['model'],
+        'n_train': len(y_train),
+        'y_test': y_test,
+        'prediction': prediction,
+        'benchmark': np.full(len(y_test), y_train.mean()),
+        'fit_seconds': fit_seconds,
+    }
+
+
+class WalkForwardBacktester:
+    """Retrains and scores the production models fold by fold"""
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        models_dir: Optional[Path] = None,
+        start: str = DEFAULT_START,
+        step_months: int = DEFAULT_STEP_MONTHS,
+        window_months: Optional[int] = None,
+        model_names: Sequence[str] = ('nprs1', 'rf11'),
+        n_jobs: Optional[int] = None,
+        cache_dir: Optional[Path] = None
+    ):
+        """
+        Args:
+            df: Merged dataset (DataLoader.merge_all_data())
+            models_dir: Directory with the model manifest; hyperparameters and
+                feature lists are taken from the registered models
+            start: First test date
+            step_months: Test block length in months
+            window_months: Rolling training window (None = expanding)
+            model_names: Models to backtest
+            n_jobs: Worker processes (None = all CPUs, 1 = in process)
+            cache_dir: Where fold matrices are cached (defaults to <cache>/backtest)
+        """
+        self.df = df.copy()
+        self.df['Date'] = pd.to_datetime(self.df['Date'])
+        self.predictor = ModelPredictor(models_dir or DEFAULT_MODELS_DIR)
+        self.model_names = list(model_names)
+        self.folds = make_folds(self.df['Date'], start, step_months, window_months)
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir() / 'backtest'
+        self._estimators = {}
+
+        self.features = {name: list(self.predictor.get_schema(name).features) for name in self.model_names}
+        self.columns = list(dict.fromkeys(f for name in self.model_names for f in self.features[name]))
+        self.data_key = hashlib.sha1(
+            pd.util.hash_pandas_object(self.df, index=False).to_numpy().tobytes()
+            + repr(self.columns).encode()
+        ).hexdigest()[:16]
+
+    def estimator(self, model_name: str):
+        """Unfitted copy of a registered model, with its production hyperparameters"""
+        if model_name not in self._estimators:
+            source = self.predictor.store.source_path(model_name)
+            with open(source, 'rb') as f:
+                model = pickle.load(f)
+            if not isinstance(model, (RandomForestClassifier, RandomForestRegressor)):
+                raise TypeError(f"{source} is not a scikit-learn Random Forest")
+            self._estimators[model_name] = clone(model).set_params(n_jobs=1)
+        return clone(self._estimators[model_name])
+
+    def fold_matrices(self, fold: Fold) -> Path:
+        """
+        Cached float32 train/test matrices of a fold
+
+        Features come from a FeatureEngineer cut off at the fold start (so
+        training-window statistics never see the test block), NaNs are filled
+        with the training-window medians.
+        """
+        path = self.cache_dir / self.data_key / f"{fold.train_start:%Y%m}-{fold.test_start:%Y%m}-{fold.test_end:%Y%m}.npz"
+        if path.exists():
+            return path
+
+        engineer = FeatureEngineer(train_cutoff=str(fold.test_start.date()))
+        features = engineer.create_binary_target(engineer.create_all_features(self.df)).iloc[1:]
+        features = features.reindex(columns=list(dict.fromkeys(self.columns + ['Date'] + list(TARGETS.values()))))
+
+        train = features[(features['Date'] >= fold.train_start) & (features['Date'] < fold.test_start)]
+        test = features[(features['Date'] >= fold.test_start) & (features['Date'] < fold.test_end)]
+
+        medians = FeatureImputer.fit(train, self.columns, fold.test_start).values(self.columns)
+        arrays = {'columns': np.array(self.columns)}
+        for split, frame in (('train', train), ('test', test)):
+            X = frame[self.columns].to_numpy(dtype=np.float32)
+            arrays[f"X_{split}"] = np.where(np.isnan(X), medians, X)
+            for name in self.model_names:
+                arrays[f"y_{split}_{name}"] = frame[TARGETS[name]].to_numpy(
+                    dtype=np.int64 if TARGETS[name] == 'Vol_Direction' else np.float64
+                )
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-', suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+        return path
+
+    def run(self, output_path: Optional[Path] = None) -> pd.DataFrame:
+        """
+        Run every fold and collect the metrics
+
+        Args:
+            output_path: CSV file for the per-fold metrics (None = not written)
+
+        Returns:
+            DataFrame with one row per fold and model, plus pooled 'all' rows
+        """
+        start = time.perf_counter()
+        tasks = []
+        for fold in self.folds:
+            matrix_path = self.fold_matrices(fold)
+            for name in self.model_names:
+                tasks.append({
+                    'fold': fold.index,
+                    'model': name,
+                    'features': self.features[name],
+                    'estimator': self.estimator(name),
+                    'matrix_path': str(matrix_path),
+                })
+
+        if self.n_jobs > 1:
+            with ProcessPoolExecutor(max_workers=min(self.n_jobs, len(tasks))) as pool:
+                results = list(pool.map(_fit_fold, tasks))
+        else:
+            results = [_fit_fold(task) for task in tasks]
+
+        rows = []
+        pooled = {name: [] for name in self.model_names}
+        for result in results:
+            fold = self.folds[result['fold']]
+            rows.append({
+                'fold': str(fold.index),
+                'model': result['model'],
+                'train_start': fold.train_start.date(),
+                'test_start': fold.test_start.date(),
+                'test_end': fold.test_end.date(),
+                'n_train': result['n_train'],
+                'n_test': len(result['y_test']),
+                **score_predictions(result['model'], result['y_test'], result['prediction'], result['benchmark']),
+                'fit_seconds': result['fit_seconds'],
+            })
+            pooled[result['model']].append(result)
+
+        for name, parts in pooled.items():
+            y, prediction, benchmark = (np.concatenate([p[k] for p in parts]) for k in ('y_test', 'prediction', 'benchmark'))
+            rows.append({
+                'fold': 'all',
+                'model': name,
+                'train_start': self.folds[0].train_start.date(),
+                'test_start': self.folds[0].test_start.date(),
+                'test_end': self.folds[-1].test_end.date(),
+                'n_train': max(p['n_train'] for p in parts),
+                'n_test': len(y),
+                **score_predictions(name, y, prediction, benchmark),
+                'fit_seconds': sum(p['fit_seconds'] for p in parts),
+            })
+
+        metrics = pd.DataFrame(rows, columns=METRIC_COLUMNS)
+        logger.info(f"Backtest: {len(self.folds)} folds x {len(self.model_names)} models "
+                    f"in {time.perf_counter() - start:.1f}s ({self.n_jobs} workers)")
+        if output_path is not None:
+            metrics.to_csv(output_path, index=False, float_format='%.6g')
+            logger.info(f"Backtest metrics written to {output_path}")
+        return metrics
+
+
+if __name__ == '__main__':
+    import warnings
+    from modules.data_loader import get_data_loader
+
+    warnings.filterwarnings('ignore')
+    print("Running walk-forward backtest (quarterly folds, expanding window)...")
+    df = get_data_loader().merge_all_data()
+
+    for n_jobs in (1, 2):
+        backtester = WalkForwardBacktester(df, n_jobs=n_jobs)
+        start = time.perf_counter()
+        metrics = backtester.run()
+        print(f"  {backtester.n_jobs} worker(s): {time.perf_counter() - start:.1f}s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / 'backtest_metrics.csv'
+        metrics.to_csv(output, index=False, float_format='%.6g')
+        print(f"  {len(metrics)} rows, {output.stat().st_size / 1024:.1f} KiB CSV")
+
+    pooled = metrics[metrics['fold'] == 'all'].set_index('model')
+    print(f"  NPRS-1 directional accuracy: {pooled.loc['nprs1', 'accuracy']:.1%}")
+    print(f"  RF-11 R²: {pooled.loc['rf11', 'r2']:.1%}, OOS R² vs historical mean: {pooled.loc['rf11', 'oos_r2']:.1%}, "
+          f"Clark-West p = {pooled.loc['rf11', 'cw_pvalue']:.3g}")
+    print("\n✅ Backtesting tests complete!")
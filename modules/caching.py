@@ -0,0 +1,156 @@
+"""
+OVIP - Memoization Module
+Process-wide, pluggable memoization for the headless data/feature/model core.
+The default backend is an in-memory TTL + LRU store shared by every caller in
+the process (all Streamlit sessions, or a batch job); swap it with
+set_memo_backend() for a different policy.
+"""
+
+import time
+import hashlib
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class MemoryBackend:
+    """Thread-safe in-process store with per-entry TTL and LRU eviction"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._store = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value, or the module-level _MISSING sentinel"""
+        with self._lock:
+            entry = self._store.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._store[key]
+                return _MISSING
+            self._store.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._store[key] = (value, expires_at)
+            self._store.move_to_end(key)
+            while len(self._store) > self.max_entries:
+                self._store.popitem(last=False)
+
+    def clear(self, name: Optional[str] = None):
+        """Drop every entry, or only those of the memoized function `name`"""
+        with self._lock:
+            if name is None:
+                self._store.clear()
+            else:
+                for key in [k for k in self._store if k[0] == name]:
+                    del self._store[key]
+
+
+_backend = MemoryBackend()
+
+
+def set_memo_backend(backend) -> None:
+    """
+    Install a backend exposing get(key) / set(key, value, ttl) / clear(name=None)
+
+    Keys are (function name, call key) tuples; clear(name) drops one function's entries.
+    """
+    global _backend
+    _backend = backend
+
+
+def get_memo_backend():
+    return _backend
+
+
+def clear_memo() -> None:
+    """Drop every memoized result in the current backend"""
+    _backend.clear()
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Content hash of a DataFrame, for memoizing functions that take frames"""
+    hashed = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha1(hashed.tobytes() + str(list(df.columns)).encode()).hexdigest()
+
+
+def memoize(
+    ttl: Optional[float] = None,
+    key: Optional[Callable[..., Hashable]] = None
+) -> Callable:
+    """
+    Memoize a function in the active backend
+
+    Args:
+        ttl: Seconds before an entry expires (None = until evicted)
+        key: Builds the cache key from the call arguments. Defaults to the
+            arguments themselves, which must then be hashable.
+
+    Returns:
+        Decorator; the wrapped function gains a .clear() helper that drops
+        its own entries only (clear_memo() drops everything).
+        Exceptions are never cached.
+    """
+    def decorator(func: Callable) -> Callable:
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                if key is not None:
+                    call_key: Tuple = (name, key(*args, **kwargs))
+                else:
+                    call_key = (name, args, tuple(sorted(kwargs.items())))
+                hash(call_key)
+            except TypeError:
+                logger.debug(f"Unhashable arguments for {name}, calling uncached")
+                return func(*args, **kwargs)
+
+            value = _backend.get(call_key)
+            if value is _MISSING:
+                value = func(*args, **kwargs)
+                _backend.set(call_key, value, ttl)
+            return value
+
+        wrapper.clear = lambda: _backend.clear(name)
+        return wrapper
+
+    return decorator
+
+
+if __name__ == '__main__':
+    print("Testing memoization...")
+    calls = []
+
+    @memoize()
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    @memoize()
+    def cube(x):
+        calls.append(x)
+        return x ** 3
+
+    assert [square(3), square(3), cube(3), cube(3)] == [9, 9, 27, 27] and calls == [3, 3]
+    square.clear()
+    assert square(3) == 9 and cube(3) == 27 and calls == [3, 3, 3]
+    clear_memo()
+    cube(3)
+    assert calls == [3, 3, 3, 3]
+    print("  clear() drops only the function's own entries, clear_memo() drops all")
+    print("\n✅ Memoization tests complete!")
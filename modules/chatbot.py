@@ -1,42 +1,24 @@
-import streamlit as st
-import requests
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from modules.settings import get_secret
+from modules.llm_dispatcher import get_llm_dispatcher
+from modules.retrieval import get_rag_index, DEFAULT_TOP_K
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Free Hugging Face Model (Mistral 7B)
-API_URL = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.2"
-
 class OVIPAssistant:
-    def __init__(self, df):
-        self.vectorizer, self.tfidf_matrix, self.rag_df = self._setup_knowledge_base(df)
+    def __init__(self, df, top_k=DEFAULT_TOP_K):
+        self.top_k = top_k
+        self.index = self._setup_knowledge_base(df)
 
     def _setup_knowledge_base(self, df):
         """Translates CSV numerical data into narrative text for the LLM."""
-        df = df.copy()
-        
-        # Build sentences that the AI can actually read
-        df['rag_context'] = df.apply(lambda x: (
-            f"On {x['Date'].strftime('%Y-%m-%d')}: "
-            f"WTI Crude Price was ${x.get('WTI', 0):.2f}. "
-            f"Market Volatility was {x.get('Volatility', 0):.3f}. "
-            f"Crisis Probability was {x.get('Crisis_Prob', 0):.2f}. "
-            f"News Sentiment Score was {x.get('Score', 0):.2f}."
-        ), axis=1)
-        
-        vectorizer = TfidfVectorizer(stop_words='english')
-        tfidf_matrix = vectorizer.fit_transform(df['rag_context'].fillna(""))
-        return vectorizer, tfidf_matrix, df
+        # Sentences the AI can actually read, indexed once per data version and shared on disk
+        return get_rag_index(df, 'narrative')
 
     def get_response(self, user_query):
         """Retrieves relevant history and queries the LLM."""
-        # 1. RAG Search (Find Top 3 most relevant days)
-        query_vec = self.vectorizer.transform([user_query])
-        similarity = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
-        top_indices = similarity.argsort()[-3:][::-1]
-        context_text = "\n".join([self.rag_df.iloc[i]['rag_context'] for i in top_indices])
+        # 1. RAG Search (Find the top_k most relevant days)
+        context_text = "\n".join(self.index.top_contexts(user_query, self.top_k))
         
         # 2. Strict Prompt Construction
         prompt = f"""<s>[INST] You are OVIP, an elite AI for oil market risk analysis.
@@ -50,23 +32,17 @@ USER QUESTION:
 {user_query}
 [/INST]"""
 
-        # 3. Call Hugging Face API
+        # 3. Call Hugging Face API (Free Mistral 7B) through the shared dispatcher
         try:
-            hf_token = st.secrets.get('HF_TOKEN', None)
+            hf_token = get_secret('HF_TOKEN')
             if not hf_token:
-                return "⚠️ API Error: HF_TOKEN not found in .streamlit/secrets.toml"
+                return "⚠️ API Error: HF_TOKEN not found in the environment or .streamlit/secrets.toml"
 
-            headers = {"Authorization": f"Bearer {hf_token}"}
-            payload = {
-                "inputs": prompt, 
-                "parameters": {"max_new_tokens": 150, "temperature": 0.2, "return_full_text": False},
-                "options": {"wait_for_model": True}
-            }
-            
-            response = requests.post(API_URL, headers=headers, json=payload)
-            response.raise_for_status()
-            
-            return response.json()[0]['generated_text'].strip()
+            result = get_llm_dispatcher().complete(
+                [{"role": "user", "content": prompt}],
+                backend='huggingface', max_tokens=150, temperature=0.2
+            )
+            return result.text
             
         except Exception as e:
             logger.error(f"Chatbot Error: {str(e)}")
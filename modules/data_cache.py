@@ -0,0 +1,217 @@
+"""
+OVIP - Columnar Data Cache
+Stores merged, typed frames as one .npy file per column so warm starts are
+memory-mapped loads instead of CSV parsing. Free of Streamlit, so CLI tools,
+batch jobs and tests can share the same cache as the app.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import logging
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / 'data' / '.cache'
+
+
+def default_cache_dir() -> Path:
+    """Cache root shared by all on-disk caches: $OVIP_CACHE_DIR or data/.cache"""
+    return Path(os.environ.get('OVIP_CACHE_DIR', DEFAULT_CACHE_DIR))
+
+
+def source_signature(sources: Sequence[Path]) -> Dict[str, List[int]]:
+    """Size and mtime (ns) of every source file, keyed by file name"""
+    signature = {}
+    for path in sources:
+        stat = Path(path).stat()
+        signature[Path(path).name] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+def signature_key(sources: Sequence[Path]) -> str:
+    """Short stable hash of the source signature, usable as a data version"""
+    payload = json.dumps(source_signature(sources), sort_keys=True).encode()
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+
+class ColumnarCache:
+    """On-disk cache of DataFrames in a columnar, memory-mappable layout"""
+
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, cache_dir: Optional[Path] = None):
+        """
+        Args:
+            cache_dir: Root cache directory (defaults to $OVIP_CACHE_DIR or data/.cache)
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+
+    def _entry_dir(self, name: str, key: str) -> Path:
+        return self.cache_dir / name / key
+
+    def load(
+        self,
+        name: str,
+        sources: Sequence[Path],
+        columns: Optional[Sequence[str]] = None,
+        rows: Optional[slice] = None
+    ) -> Optional[pd.DataFrame]:
+        """
+        Load a cached frame if it was built from the current source files
+
+        Args:
+            name: Cache entry name
+            sources: Files the frame was built from
+            columns: Only read these columns (others are never opened; unknown names are skipped)
+            rows: Only read this row range (applied to the memory maps, before string decoding)
+
+        Returns:
+            Memory-mapped DataFrame, or None on a cache miss. The maps are
+            copy-on-write: in-place edits stay private to the caller and
+            never reach the cache files
+        """
+        entry = self._entry_dir(name, signature_key(sources))
+        manifest_path = entry / self.MANIFEST
+        if not manifest_path.exists():
+            return None
+
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+
+            wanted = None if columns is None else set(columns)
+            rows = rows if rows is not None else slice(None)
+            loaded = {}
+            for col in manifest['columns']:
+                if wanted is not None and col['name'] not in wanted:
+                    continue
+                values = np.load(entry / col['file'], mmap_mode='c')[rows]
+                if col['kind'] == 'string':
+                    values = pd.Series(values, dtype=object)
+                    if col.get('null_file'):
+                        values[np.load(entry / col['null_file'])[rows]] = np.nan
+                    values = values.astype(col['dtype'])
+                loaded[col['name']] = values
+
+            return pd.DataFrame(loaded, copy=False)
+
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry {entry}: {e}")
+            return None
+
+    def save(self, name: str, df: pd.DataFrame, sources: Sequence[Path]) -> Path:
+        """
+        Write a frame to the cache, replacing older versions of the same entry
+
+        Args:
+            name: Cache entry name
+            df: Frame to store (index is not stored)
+            sources: Files the frame was built from
+
+        Returns:
+            Path of the written cache entry
+        """
+        key = signature_key(sources)
+        entry = self._entry_dir(name, key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write into a temp dir and rename, so readers never see partial entries
+        tmp_dir = Path(tempfile.mkdtemp(dir=entry.parent, prefix='.tmp-'))
+        columns = []
+        for i, (col_name, series) in enumerate(df.items()):
+            col = {'name': col_name, 'file': f'{i:03d}.npy'}
+            values = series.to_numpy()
+
+            if values.dtype.kind in 'biufcmM':
+                col['kind'] = 'array'
+            else:
+                col['kind'] = 'string'
+                col['dtype'] = str(series.dtype)
+                nulls = series.isna().to_numpy()
+                values = np.asarray(series.astype(str).where(~nulls, ''), dtype=str)
+                if nulls.any():
+                    col['null_file'] = f'{i:03d}_null.npy'
+                    np.save(tmp_dir / col['null_file'], nulls)
+
+            np.save(tmp_dir / col['file'], np.ascontiguousarray(values))
+            columns.append(col)
+
+        with open(tmp_dir / self.MANIFEST, 'w') as f:
+            json.dump({'signature': source_signature(sources), 'columns': columns}, f)
+
+        try:
+            os.rename(tmp_dir, entry)
+        except OSError:
+            # Another process wrote the same version first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        for old in entry.parent.iterdir():
+            if old.name != key and not old.name.startswith('.tmp-'):
+                shutil.rmtree(old, ignore_errors=True)
+
+        logger.info(f"Cached {name} ({len(df)} rows) at {entry}")
+        return entry
+
+    def get_or_build(
+        self,
+        name: str,
+        sources: Sequence[Path],
+        build: Callable[[], pd.DataFrame]
+    ) -> pd.DataFrame:
+        """
+        Load a frame from the cache, building and storing it on a miss
+
+        Args:
+            name: Cache entry name
+            sources: Files the frame is built from (size + mtime form the key)
+            build: Callable producing the frame from the sources
+
+        Returns:
+            Cached or freshly built DataFrame
+        """
+        df = self.load(name, sources)
+        if df is not None:
+            return df
+
+        df = build()
+        try:
+            self.save(name, df, sources)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {name}: {e}")
+        return df
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    from modules.data_loader import DataLoader
+
+    print("Testing ColumnarCache...")
+    loader = DataLoader()
+    sources = loader.source_files
+    cache = ColumnarCache(Path(tempfile.mkdtemp()))
+
+    start = time.perf_counter()
+    cold = cache.get_or_build('merged_final', sources, loader.build_merged_data)
+    cold_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    warm = cache.get_or_build('merged_final', sources, loader.build_merged_data)
+    warm_time = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(cold, warm)
+    warm.loc[0, 'WTI'] = -1.0
+    assert cache.load('merged_final', sources)['WTI'].iat[0] == cold['WTI'].iat[0]
+    print(f"  Cold (CSV parse + merge): {cold_time * 1000:.1f}ms")
+    print(f"  Warm (memory-mapped):     {warm_time * 1000:.1f}ms")
+    print("\n✅ Columnar cache tests complete!")
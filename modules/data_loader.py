@@ -1,51 +1,78 @@
+import logging
 import pandas as pd
-import streamlit as st
 from pathlib import Path
+from modules.caching import memoize
+from modules.data_cache import ColumnarCache, signature_key
+from modules.market_store import DEFAULT_MARKET, MARKET_COLUMN, MarketStore
+
+logger = logging.getLogger(__name__)
 
 class DataLoader:
-    def __init__(self):
+    def __init__(self, cache_dir=None):
         # Dynamically find the data folder
         self.data_dir = Path(__file__).resolve().parent.parent / 'data'
-        
-    @st.cache_data(ttl=3600)
-    def merge_all_data(_self):
+        self.cache = ColumnarCache(cache_dir)
+        self.markets = MarketStore(self)
+        self.last_error = None
+
+    @property
+    def source_files(self):
+        return [self.data_dir / 'merged_final.csv', self.data_dir / 'data_model_performance_2025.csv']
+
+    @property
+    def data_version(self):
+        """Hash of the source files' size and mtime; changes whenever the data does."""
+        return signature_key(self.source_files)
+
+    def build_merged_data(self):
+        """Parses and merges the source CSVs (the slow path behind the columnar cache)."""
+        # 1. Load the Single Master Dataset
+        # (Make sure to rename your downloaded file to 'merged_final.csv' before putting it in the data folder)
+        df_main = pd.read_csv(self.data_dir / 'merged_final.csv')
+        df_perf = pd.read_csv(self.data_dir / 'data_model_performance_2025.csv')
+
+        df_main['Date'] = pd.to_datetime(df_main['Date'])
+        df_perf['Date'] = pd.to_datetime(df_perf['Date'])
+
+        # 2. Merge Performance Data for the Dashboard Charts
+        cols_to_use = ['Date', 'Predicted_Vol', 'Error', 'Uncertainty_Factor']
+        df_combined = pd.merge(df_main, df_perf[cols_to_use], on='Date', how='left')
+
+        return df_combined.sort_values('Date').reset_index(drop=True)
+
+    @memoize(key=lambda self: (str(self.data_dir), str(self.cache.cache_dir), self.data_version))
+    def _load_merged_data(self):
+        # Warm starts memory-map the cached WTI partition instead of re-parsing the CSVs
+        return self.markets.load(DEFAULT_MARKET).drop(columns=MARKET_COLUMN)
+
+    def load(self, market=DEFAULT_MARKET, start=None, end=None, columns=None):
+        """
+        Long-format market data with predicate pushdown (see MarketStore.load).
+
+        market is a market ID ('WTI', 'BRENT', ...), a list of IDs, or None for
+        every market; start/end bound the dates (inclusive) and columns limits
+        what is read. Only the matching partitions, columns and rows are read.
+        """
+        return self.markets.load(market, start, end, columns)
+
+    def merge_all_data(self):
+        """Merged dataset, memoized per data version and shared by every caller in the process."""
         try:
-            # 1. Load the Single Master Dataset
-            # (Make sure to rename your downloaded file to 'merged_final.csv' before putting it in the data folder)
-            df_main = pd.read_csv(_self.data_dir / 'merged_final.csv')
-            df_perf = pd.read_csv(_self.data_dir / 'data_model_performance_2025.csv')
-            
-            df_main['Date'] = pd.to_datetime(df_main['Date'])
-            df_perf['Date'] = pd.to_datetime(df_perf['Date'])
-            
-            # 2. Merge Performance Data for the Dashboard Charts
-            cols_to_use = ['Date', 'Predicted_Vol', 'Error', 'Uncertainty_Factor']
-            df_combined = pd.merge(df_main, df_perf[cols_to_use], on='Date', how='left')
-            
-            return df_combined.sort_values('Date').reset_index(drop=True)
-            
+            self.last_error = None
+            # Shallow copy so callers adding columns never touch the shared frame
+            return self._load_merged_data().copy(deep=False)
+
         except Exception as e:
-            st.error(f"Data Loader Error: {e}")
+            self.last_error = e
+            logger.error(f"Data Loader Error: {e}")
             return pd.DataFrame()
 
-    def get_latest_metrics(self):
-        df = self.merge_all_data()
-        if df.empty: return None
-        
-        latest = df.iloc[-1]
-        previous = df.iloc[-2]
-        
-        # Determine Regime State dynamically
-        regime_str = "CRISIS" if latest['Crisis_Prob'] > 0.5 else "MODERATE" if latest['Crisis_Prob'] > 0.1 else "CALM"
-        
-        return {
-            'price': latest['WTI'],
-            'price_change': ((latest['WTI'] - previous['WTI']) / previous['WTI']) * 100,
-            'volatility': latest['Volatility'],
-            'crisis_prob': latest['Crisis_Prob'],
-            'regime': regime_str,
-            'sentiment': latest.get('Score', 0)
-        }
+    def get_latest_metrics(self, market=DEFAULT_MARKET):
+        """Headline metrics of a market from the shared snapshot (built once per data version)."""
+        from modules.snapshot import get_latest_snapshot
+
+        snapshot = get_latest_snapshot(self, market)
+        return snapshot.as_metrics() if snapshot is not None else None
 
 def get_data_loader():
     return DataLoader()
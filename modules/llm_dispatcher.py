@@ -0,0 +1,394 @@
+"""
+OVIP - LLM Dispatcher Module
+Concurrency control in front of the LLM gateway. All model calls in the process
+go through one asyncio loop that bounds the number of in-flight requests,
+spaces them with a token bucket sized to the provider's rate limit, serves
+higher-priority lanes first (dashboard summaries before ad-hoc chat), and
+coalesces identical in-flight prompts into one request. Provider 429s pause the
+bucket for the advertised Retry-After and requeue the request instead of
+blocking a script thread in a retry loop; streams get the same treatment for a
+429 that arrives before their first token.
+
+Streamlit script threads use the synchronous facade (complete / stream), which
+hands work to the loop running on a background thread.
+"""
+
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+import itertools
+import concurrent.futures
+from typing import Awaitable, Callable, Dict, Iterator, Optional
+
+import requests
+
+from modules.settings import get_secret
+from modules.llm_gateway import LLMGateway, LLMResult, Messages, get_llm_gateway
+
+logger = logging.getLogger(__name__)
+
+# Lower value = served first
+PRIORITIES = {'dashboard': 0, 'chat': 1}
+
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_REQUESTS_PER_MINUTE = 30
+DEFAULT_BURST = 5
+MAX_RATE_LIMIT_RETRIES = 3
+DEFAULT_QUEUE_TIMEOUT = 120.0
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a token (and any provider back-off) is available, then take it"""
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(self.paused_until - now, (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0)
+            if wait <= 0:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hold every request for `seconds` (e.g. a 429 Retry-After) and drain the burst"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+def _retry_after(error: requests.HTTPError) -> Optional[float]:
+    """Seconds to back off for a 429 response, or None for any other error"""
+    response = error.response
+    if response is None or response.status_code != 429:
+        return None
+    try:
+        return float(response.headers.get('Retry-After', 1.0))
+    except ValueError:
+        return 1.0
+
+
+def prompt_key(messages: Messages, backend: Optional[str], params: Dict) -> str:
+    """Identity of a request for coalescing"""
+    payload = json.dumps([backend, messages, params], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class LLMDispatcher:
+    """Bounded, rate-limited, prioritized access to the LLM gateway"""
+
+    def __init__(
+        self,
+        gateway: Optional[LLMGateway] = None,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        burst: int = DEFAULT_BURST
+    ):
+        """
+        Args:
+            gateway: Gateway that performs the HTTP calls (defaults to the shared one)
+            max_in_flight: Requests allowed at the provider at once
+            requests_per_minute: Sustained request rate (provider limit)
+            burst: Requests allowed back-to-back before rate limiting applies
+        """
+        self.gateway = gateway or get_llm_gateway()
+        self.max_in_flight = max_in_flight
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self.metrics = {'submitted': 0, 'coalesced': 0, 'dispatched': 0, 'rate_limited': 0}
+
+        self._seq = itertools.count()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name='llm-dispatcher', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    # -- event loop side ---------------------------------------------------
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.PriorityQueue()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._loop.create_task(self._schedule())
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _schedule(self):
+        """Hand the highest-priority waiting job each free, rate-limited slot"""
+        while True:
+            await self._slots.acquire()
+            _, _, job = await self._queue.get()
+            await self.bucket.acquire()
+            self.metrics['dispatched'] += 1
+            self._loop.create_task(self._run_job(job))
+
+    async def _run_job(self, job: Callable[[], Awaitable]):
+        try:
+            await job()
+        finally:
+            self._slots.release()
+
+    def _enqueue(self, priority: str, job: Callable[[], Awaitable]):
+        self._queue.put_nowait((PRIORITIES[priority], next(self._seq), job))
+
+    async def submit(
+        self,
+        messages: Messages,
+        backend: Optional[str] = None,
+        priority: str = 'chat',
+        **params
+    ) -> LLMResult:
+        """
+        Queue a completion; identical requests already in flight share one call
+
+        Must be awaited on the dispatcher's loop (the sync facade does this).
+        """
+        self.metrics['submitted'] += 1
+        key = prompt_key(messages, backend, params)
+        if key in self._inflight:
+            self.metrics['coalesced'] += 1
+            return await asyncio.shield(self._inflight[key])
+
+        future = self._loop.create_future()
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        attempts = itertools.count()
+
+        async def job():
+            try:
+                result = await asyncio.to_thread(self.gateway.complete, messages, backend, **params)
+            except requests.HTTPError as e:
+                retry_after = _retry_after(e)
+                if retry_after is None or next(attempts) >= MAX_RATE_LIMIT_RETRIES:
+                    future.set_exception(e)
+                    return
+                self.metrics['rate_limited'] += 1
+                logger.warning(f"LLM provider rate limited, backing off {retry_after:.1f}s")
+                self.bucket.pause(retry_after)
+                self._enqueue(priority, job)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+        self._enqueue(priority, job)
+        return await asyncio.shield(future)
+
+    async def _acquire_slot(self, priority: str) -> asyncio.Event:
+        """Wait for a dispatch slot; the slot is held until the returned event is set"""
+        granted = self._loop.create_future()
+        release = asyncio.Event()
+
+        async def job():
+            if granted.done():
+                # The caller stopped waiting; hand the slot straight back
+                return
+            granted.set_result(release)
+            await release.wait()
+
+        self._enqueue(priority, job)
+        return await granted
+
+    def _hold_slot(self, priority: str, timeout: Optional[float]) -> asyncio.Event:
+        """Block the calling thread until a dispatch slot is granted, at most `timeout` seconds"""
+        future = asyncio.run_coroutine_threadsafe(self._acquire_slot(priority), self._loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            if not future.cancel():
+                # Granted just as the wait expired: release it again
+                self._loop.call_soon_threadsafe(future.result().set)
+            raise TimeoutError(f"No LLM dispatch slot free within {timeout:g}s") from None
+
+    # -- synchronous facade ------------------------------------------------
+
+    def complete(
+        self,
+        messages: Messages,
+        backend: Optional[str] = None,
+        priority: str = 'chat',
+        timeout: Optional[float] = None,
+        **params
+    ) -> LLMResult:
+        """Blocking submit() for script threads"""
+        future = asyncio.run_coroutine_threadsafe(self.submit(messages, backend, priority, **params), self._loop)
+        return future.result(timeout)
+
+    def stream(
+        self,
+        messages: Messages,
+        backend: Optional[str] = None,
+        priority: str = 'chat',
+        timeout: Optional[float] = DEFAULT_QUEUE_TIMEOUT,
+        **params
+    ) -> Iterator[str]:
+        """
+        Streamed completion that occupies one dispatch slot while it runs
+
+        A 429 before the first token pauses the bucket for its Retry-After and
+        queues the stream again, as submit() does; once tokens have been
+        yielded, errors propagate. timeout bounds each wait for a slot
+        (TimeoutError). Streams are not coalesced; tokens are read on the
+        calling thread.
+        """
+        self.metrics['submitted'] += 1
+        for attempt in itertools.count():
+            release = self._hold_slot(priority, timeout)
+            tokens = self.gateway.stream(messages, backend, **params)
+            try:
+                try:
+                    first = next(tokens, None)
+                except requests.HTTPError as e:
+                    retry_after = _retry_after(e)
+                    if retry_after is None or attempt >= MAX_RATE_LIMIT_RETRIES:
+                        raise
+                    self.metrics['rate_limited'] += 1
+                    logger.warning(f"LLM provider rate limited a stream, backing off {retry_after:.1f}s")
+                    # Paused before the slot is released, so the requeued stream waits it out
+                    self._loop.call_soon_threadsafe(self.bucket.pause, retry_after)
+                    continue
+                if first is not None:
+                    yield first
+                    yield from tokens
+                return
+            finally:
+                tokens.close()
+                self._loop.call_soon_threadsafe(release.set)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.metrics, queued=self._queue.qsize(), in_flight=len(self._inflight))
+
+
+_dispatcher: Optional[LLMDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_llm_dispatcher() -> LLMDispatcher:
+    """Process-wide dispatcher; limits come from OVIP_LLM_MAX_IN_FLIGHT / OVIP_LLM_RPM"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = LLMDispatcher(
+                    max_in_flight=int(get_secret('OVIP_LLM_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT)),
+                    requests_per_minute=float(get_secret('OVIP_LLM_RPM', DEFAULT_REQUESTS_PER_MINUTE)),
+                )
+    return _dispatcher
+
+
+if __name__ == '__main__':
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from modules.llm_gateway import local_backend
+
+    print("Testing LLM dispatcher against a local fake server...")
+    state = {'active': 0, 'peak': 0, 'calls': [], 'throttle': 1}
+    state_lock = threading.Lock()
+
+    class FakeHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            content = body['messages'][-1]['content']
+            if content == 'hold':
+                time.sleep(0.5)
+            with state_lock:
+                if content == 'throttled' and state['throttle']:
+                    state['throttle'] -= 1
+                    self.send_response(429)
+                    self.send_header('Retry-After', '0.2')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+                state['calls'].append(content)
+            time.sleep(0.1)
+            with state_lock:
+                state['active'] -= 1
+            if body.get('stream'):
+                event = json.dumps({'choices': [{'delta': {'content': f"re: {content}"}}]})
+                reply = f"data: {event}\n\ndata: [DONE]\n\n".encode()
+            else:
+                reply = json.dumps({'choices': [{'message': {'content': f"re: {content}"}}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    gateway = LLMGateway()
+    gateway.register_backend(local_backend(f"http://127.0.0.1:{server.server_port}/v1/chat/completions"))
+    dispatcher = LLMDispatcher(gateway, max_in_flight=2, requests_per_minute=600, burst=2)
+
+    def ask(content, priority='chat'):
+        return dispatcher.complete([{'role': 'user', 'content': content}], backend='local', priority=priority).text
+
+    # Coalescing and the in-flight bound
+    with ThreadPoolExecutor(12) as pool:
+        answers = list(pool.map(ask, ['same'] * 6 + [f"q{i}" for i in range(6)]))
+    assert answers[:6] == ['re: same'] * 6
+    assert state['calls'].count('same') == 1 and state['peak'] <= 2
+    print(f"  12 requests -> {len(state['calls'])} calls, peak in flight {state['peak']}, {dispatcher.stats()}")
+
+    # Priority lanes: with the slots busy, dashboard work jumps the chat queue
+    state['calls'].clear()
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(ask, f"busy{i}") for i in range(2)]
+        time.sleep(0.02)
+        futures += [pool.submit(ask, f"chat{i}") for i in range(3)]
+        time.sleep(0.02)
+        futures += [pool.submit(ask, 'summary', 'dashboard')]
+        [f.result() for f in futures]
+    assert state['calls'].index('summary') < state['calls'].index('chat2')
+    print(f"  dispatch order: {state['calls']}")
+
+    # 429 -> back off for Retry-After and requeue
+    start = time.perf_counter()
+    assert ask('throttled') == 're: throttled'
+    print(f"  429 retried after {time.perf_counter() - start:.2f}s, rate_limited={dispatcher.metrics['rate_limited']}")
+
+    # Streams: a 429 before the first token is absorbed the same way
+    state['throttle'] = 1
+    before = dispatcher.metrics['rate_limited']
+    start = time.perf_counter()
+    tokens = list(dispatcher.stream([{'role': 'user', 'content': 'throttled'}], backend='local'))
+    assert tokens == ['re: throttled'] and dispatcher.metrics['rate_limited'] == before + 1
+    print(f"  streamed 429 retried after {time.perf_counter() - start:.2f}s")
+
+    # A stream that cannot get a slot in time fails instead of blocking, without leaking the slot
+    single = LLMDispatcher(gateway, max_in_flight=1, requests_per_minute=600, burst=2)
+    with ThreadPoolExecutor(1) as pool:
+        holder = pool.submit(lambda: list(single.stream([{'role': 'user', 'content': 'hold'}], backend='local')))
+        time.sleep(0.1)
+        try:
+            list(single.stream([{'role': 'user', 'content': 'late'}], backend='local', timeout=0.1))
+            raise AssertionError("stream waited past its timeout")
+        except TimeoutError as e:
+            print(f"  {e}")
+        holder.result()
+    assert list(single.stream([{'role': 'user', 'content': 'after'}], backend='local', timeout=5)) == ['re: after']
+
+    server.shutdown()
+    print("\n✅ LLM dispatcher tests complete!")
@@ -0,0 +1,356 @@
+"""
+OVIP - LLM Gateway Module
+Process-wide client for the chat models behind the AI terminals. One pooled
+requests.Session (keep-alive, bounded connection pool) is shared by every page
+and session, backends are pluggable (Groq, Hugging Face Inference, or a local
+OpenAI-compatible stub for offline runs), and each call reports its
+time-to-first-byte and total latency. stream() yields tokens from the
+providers' server-sent-event mode as they arrive.
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from modules.settings import get_secret
+
+logger = logging.getLogger(__name__)
+
+GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+HF_URL = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.2"
+LOCAL_URL = "http://127.0.0.1:8080/v1/chat/completions"
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (5.0, 60.0)
+
+Messages = List[Dict[str, str]]
+
+
+@dataclass
+class LLMResult:
+    """Completion text plus per-request timing"""
+    text: str
+    backend: str
+    model: str
+    ttfb: float
+    total: float
+    status: int = 200
+
+
+@dataclass
+class LLMBackend:
+    """
+    How to address one provider
+
+    build_payload maps (messages, params) to the JSON body, parse_response
+    maps the decoded JSON back to the completion text and parse_stream_event
+    maps one decoded server-sent event to its token text.
+    """
+    name: str
+    url: str
+    model: str
+    api_key_name: Optional[str]
+    build_payload: Callable[['LLMBackend', Messages, Dict], Dict]
+    parse_response: Callable[[object], str]
+    parse_stream_event: Callable[[Dict], str]
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    def request_headers(self) -> Dict[str, str]:
+        headers = dict(self.headers)
+        if self.api_key_name:
+            api_key = get_secret(self.api_key_name)
+            if not api_key:
+                raise RuntimeError(f"{self.api_key_name} not found in the environment or .streamlit/secrets.toml")
+            headers['Authorization'] = f"Bearer {api_key}"
+        return headers
+
+
+def _chat_completions_payload(backend: LLMBackend, messages: Messages, params: Dict) -> Dict:
+    return {'model': backend.model, 'messages': messages, **params}
+
+
+def _chat_completions_text(body) -> str:
+    return body['choices'][0]['message']['content']
+
+
+def _chat_completions_delta(event: Dict) -> str:
+    choices = event.get('choices') or [{}]
+    return choices[0].get('delta', {}).get('content') or ""
+
+
+def _hf_payload(backend: LLMBackend, messages: Messages, params: Dict) -> Dict:
+    # Text-generation endpoint: the prompt is the concatenated message contents
+    parameters = {'return_full_text': False}
+    if 'max_tokens' in params:
+        parameters['max_new_tokens'] = params['max_tokens']
+    if 'temperature' in params:
+        parameters['temperature'] = params['temperature']
+    return {
+        'inputs': "\n\n".join(m['content'] for m in messages),
+        'parameters': parameters,
+        'options': {'wait_for_model': True},
+    }
+
+
+def _hf_text(body) -> str:
+    return body[0]['generated_text'].strip()
+
+
+def _hf_token(event: Dict) -> str:
+    token = event.get('token', {})
+    return "" if token.get('special') else token.get('text', "")
+
+
+def groq_backend(model: str = "llama-3.3-70b-versatile") -> LLMBackend:
+    """Groq through its OpenAI-compatible REST endpoint (no SDK client per call)"""
+    return LLMBackend('groq', GROQ_URL, model, 'GROQ_API_KEY', _chat_completions_payload, _chat_completions_text,
+                      _chat_completions_delta)
+
+
+def huggingface_backend(url: str = HF_URL) -> LLMBackend:
+    """Hugging Face Inference API text generation"""
+    return LLMBackend('huggingface', url, url.rsplit('/models/', 1)[-1], 'HF_TOKEN', _hf_payload, _hf_text, _hf_token)
+
+
+def local_backend(url: Optional[str] = None, model: str = "stub") -> LLMBackend:
+    """OpenAI-compatible server on localhost (OVIP_LOCAL_LLM_URL), for offline runs"""
+    url = url or get_secret('OVIP_LOCAL_LLM_URL', LOCAL_URL)
+    return LLMBackend('local', url, model, None, _chat_completions_payload, _chat_completions_text,
+                      _chat_completions_delta)
+
+
+class LLMGateway:
+    """Pooled HTTP client routing completions to registered backends"""
+
+    def __init__(
+        self,
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+        pool_size: int = 8,
+        history_size: int = 100
+    ):
+        """
+        Args:
+            timeout: (connect, read) timeout in seconds for every request
+            pool_size: Keep-alive connections kept per host
+            history_size: Recent results kept for latency reporting
+        """
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.backends: Dict[str, LLMBackend] = {}
+        self.history = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+
+        for backend in (groq_backend(), huggingface_backend(), local_backend()):
+            self.register_backend(backend)
+
+    def register_backend(self, backend: LLMBackend):
+        """Add or replace a backend by name"""
+        self.backends[backend.name] = backend
+
+    def get_backend(self, name: Optional[str] = None) -> LLMBackend:
+        """Backend by name, defaulting to OVIP_LLM_BACKEND (or groq)"""
+        name = name or get_secret('OVIP_LLM_BACKEND', 'groq')
+        if name not in self.backends:
+            raise KeyError(f"Unknown LLM backend '{name}'. Available: {sorted(self.backends)}")
+        return self.backends[name]
+
+    def complete(self, messages: Messages, backend: Optional[str] = None, **params) -> LLMResult:
+        """
+        Run one completion
+
+        Args:
+            messages: Chat messages as {'role', 'content'} dicts
+            backend: Backend name (see get_backend)
+            **params: Generation parameters such as temperature and max_tokens
+
+        Returns:
+            LLMResult with the completion text and timings in seconds
+
+        Raises:
+            requests.RequestException on transport or HTTP errors
+        """
+        target = self.get_backend(backend)
+        payload = target.build_payload(target, messages, params)
+
+        start = time.perf_counter()
+        # stream=True returns as soon as the headers arrive, which marks the first byte
+        with self.session.post(
+            target.url, json=payload, headers=target.request_headers(),
+            timeout=self.timeout, stream=True
+        ) as response:
+            ttfb = time.perf_counter() - start
+            response.raise_for_status()
+            body = response.json()
+        total = time.perf_counter() - start
+
+        return self._record(LLMResult(
+            text=target.parse_response(body),
+            backend=target.name,
+            model=target.model,
+            ttfb=ttfb,
+            total=total,
+            status=response.status_code,
+        ))
+
+    def stream(self, messages: Messages, backend: Optional[str] = None, **params) -> Iterator[str]:
+        """
+        Run one completion in streaming mode, yielding tokens as they arrive
+
+        Same arguments as complete(). The result is recorded once the stream
+        ends, with ttfb measured to the first non-empty token.
+        """
+        target = self.get_backend(backend)
+        payload = target.build_payload(target, messages, params)
+        payload['stream'] = True
+
+        start = time.perf_counter()
+        ttfb = None
+        parts = []
+        with self.session.post(
+            target.url, json=payload, headers=target.request_headers(),
+            timeout=self.timeout, stream=True
+        ) as response:
+            response.raise_for_status()
+            response.encoding = response.encoding or 'utf-8'
+
+            for line in response.iter_lines(decode_unicode=True):
+                # Server-sent events: "data: {...}" lines, terminated by "data: [DONE]".
+                # Read to the end of the body so the connection goes back to the pool.
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    continue
+
+                token = target.parse_stream_event(json.loads(data))
+                if token:
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - start
+                    parts.append(token)
+                    yield token
+
+        total = time.perf_counter() - start
+        self._record(LLMResult(
+            text="".join(parts),
+            backend=target.name,
+            model=target.model,
+            ttfb=total if ttfb is None else ttfb,
+            total=total,
+            status=response.status_code,
+        ))
+
+    def _record(self, result: LLMResult) -> LLMResult:
+        with self._lock:
+            self.history.append(result)
+        logger.info(f"LLM {result.backend}/{result.model}: ttfb {result.ttfb * 1000:.0f}ms, "
+                    f"total {result.total * 1000:.0f}ms")
+        return result
+
+    def latency_summary(self) -> Dict[str, float]:
+        """Mean and worst TTFB/total latency over the recent history (seconds)"""
+        with self._lock:
+            results = list(self.history)
+        if not results:
+            return {'requests': 0}
+        return {
+            'requests': len(results),
+            'mean_ttfb': sum(r.ttfb for r in results) / len(results),
+            'max_ttfb': max(r.ttfb for r in results),
+            'mean_total': sum(r.total for r in results) / len(results),
+            'max_total': max(r.total for r in results),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Process-wide gateway, created on first use"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
+
+
+if __name__ == '__main__':
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    print("Testing LLM gateway against a local stub...")
+    connections = set()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            connections.add(self.client_address)
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            if body.get('stream'):
+                return self.stream_reply(body)
+            reply = json.dumps({'choices': [{'message': {'content': f"echo: {body['messages'][-1]['content']}"}}]})
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply.encode())
+
+        def stream_reply(self, body):
+            # Chunked server-sent events, one token per chunk with a short delay
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            events = [{'choices': [{'delta': {'content': f"{word} "}}]} for word in body['messages'][-1]['content'].split()]
+            for event in [json.dumps(e) for e in events] + ['[DONE]']:
+                time.sleep(0.05)
+                chunk = f"data: {event}\n\n".encode()
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    gateway = LLMGateway()
+    gateway.register_backend(local_backend(f"http://127.0.0.1:{server.server_port}/v1/chat/completions"))
+    for i in range(5):
+        result = gateway.complete([{'role': 'user', 'content': f"ping {i}"}], backend='local')
+        assert result.text == f"echo: ping {i}"
+
+    summary = gateway.latency_summary()
+    print(f"  {summary['requests']} requests over {len(connections)} connection(s), "
+          f"mean ttfb {summary['mean_ttfb'] * 1000:.1f}ms, mean total {summary['mean_total'] * 1000:.1f}ms")
+    assert len(connections) == 1
+
+    print("Testing streaming...")
+    start = time.perf_counter()
+    arrivals = []
+    for token in gateway.stream([{'role': 'user', 'content': "one two three four five six"}], backend='local'):
+        arrivals.append((token, time.perf_counter() - start))
+    assert "".join(t for t, _ in arrivals) == "one two three four five six "
+    result = gateway.history[-1]
+    print(f"  {len(arrivals)} tokens, first after {arrivals[0][1] * 1000:.0f}ms, "
+          f"last after {arrivals[-1][1] * 1000:.0f}ms (recorded ttfb {result.ttfb * 1000:.0f}ms)")
+    assert arrivals[0][1] < arrivals[-1][1] / 2
+    server.shutdown()
+    print("\n✅ LLM gateway tests complete!")
@@ -0,0 +1,277 @@
+"""
+OVIP - Market Store Module
+Long-format columnar store of every market's monthly history, partitioned by
+market. Each partition is a ColumnarCache entry keyed on its own source files,
+so adding or refreshing one market never rebuilds the others, and reads push
+their predicates down to the partitions: unrequested markets are never opened,
+unrequested columns are never mapped, and the date range is cut from the
+memory-mapped (date-sorted) Date column with searchsorted before any values
+are read.
+
+WTI is built from merged_final.csv (joined with the model performance file,
+as DataLoader.build_merged_data does). Any other market is a file
+data/markets/<market>.csv in the same schema; the benchmark price keeps the
+column name 'WTI' in every partition, since features and pages read it.
+
+score_markets runs FeatureEngineer (panel mode, one series per market) and
+both models over every market in one batched pass.
+"""
+
+import logging
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from modules.data_cache import ColumnarCache, signature_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MARKET = 'WTI'
+MARKET_COLUMN = 'Market'
+PARTITION_PREFIX = 'markets'
+
+# Selector labels (Country Selector options, session market_display default) -> market ID
+MARKET_DISPLAY_NAMES = {
+    '🇺🇸 TARGET_NODE_01: WTI_CRUDE': 'WTI',
+    '🇬🇧 TARGET_NODE_02: BRENT_CRUDE': 'BRENT',
+    '🇦🇪 TARGET_NODE_03: DUBAI_CRUDE': 'DUBAI',
+    '🇺🇸 United States (WTI)': 'WTI',
+}
+
+
+def market_from_display(display: Optional[str]) -> str:
+    """Market ID for a selector label such as '🇬🇧 TARGET_NODE_02: BRENT_CRUDE' (WTI if none or unknown)"""
+    if not display:
+        return DEFAULT_MARKET
+    market = MARKET_DISPLAY_NAMES.get(display)
+    if market is None:
+        logger.warning(f"Unknown market label {display!r}, using {DEFAULT_MARKET}")
+        return DEFAULT_MARKET
+    return market
+
+
+class MarketStore:
+    """Market-partitioned columnar store behind DataLoader.load"""
+
+    def __init__(self, loader):
+        """
+        Args:
+            loader: DataLoader providing the data directory, the columnar cache
+                and the WTI build (build_merged_data)
+        """
+        self.loader = loader
+        self.cache: ColumnarCache = loader.cache
+
+    @property
+    def markets_dir(self) -> Path:
+        return Path(self.loader.data_dir) / 'markets'
+
+    def markets(self) -> List[str]:
+        """Markets with source data: WTI first, then data/markets/*.csv in name order"""
+        found = [DEFAULT_MARKET]
+        if self.markets_dir.is_dir():
+            found += [p.stem.upper() for p in sorted(self.markets_dir.glob('*.csv'))
+                      if p.stem.upper() != DEFAULT_MARKET]
+        return found
+
+    def sources(self, market: str) -> List[Path]:
+        if market == DEFAULT_MARKET:
+            return list(self.loader.source_files)
+        path = self.markets_dir / f'{market.lower()}.csv'
+        if not path.exists():
+            raise KeyError(f"Unknown market '{market}' (available: {', '.join(self.markets())})")
+        return [path]
+
+    def data_version(self, market: str) -> str:
+        """Hash of a market's source files; for WTI this is DataLoader.data_version"""
+        return signature_key(self.sources(market))
+
+    def _build(self, market: str) -> pd.DataFrame:
+        if market == DEFAULT_MARKET:
+            return self.loader.build_merged_data()
+        df = pd.read_csv(self.sources(market)[0])
+        df['Date'] = pd.to_datetime(df['Date'])
+        return df.sort_values('Date').reset_index(drop=True)
+
+    def _partition(
+        self,
+        market: str,
+        start: Optional[pd.Timestamp],
+        end: Optional[pd.Timestamp],
+        columns: Optional[Sequence[str]]
+    ) -> pd.DataFrame:
+        name = f'{PARTITION_PREFIX}/{market}'
+        sources = self.sources(market)
+        if columns is not None:
+            columns = ['Date'] + [c for c in columns if c != 'Date']
+
+        dates = self.cache.load(name, sources, columns=['Date'])
+        if dates is None:
+            built = self.cache.get_or_build(name, sources, lambda: self._build(market))
+            dates = self.cache.load(name, sources, columns=['Date'])
+            if dates is None:
+                # Cache not writable: filter the freshly built frame in memory
+                rows = _date_rows(built['Date'].to_numpy(), start, end)
+                return built.iloc[rows][columns] if columns is not None else built.iloc[rows]
+
+        rows = _date_rows(dates['Date'].to_numpy(), start, end)
+        return self.cache.load(name, sources, columns=columns, rows=rows)
+
+    def load(
+        self,
+        market: Union[str, Iterable[str], None] = DEFAULT_MARKET,
+        start=None,
+        end=None,
+        columns: Optional[Sequence[str]] = None
+    ) -> pd.DataFrame:
+        """
+        Long-format frame of one or more markets
+
+        Args:
+            market: Market ID, list of IDs, or None for every market
+            start: First date to include (inclusive)
+            end: Last date to include (inclusive)
+            columns: Columns to read (Date and Market are always included);
+                columns a partition lacks come back as NaN
+
+        Returns:
+            DataFrame with a categorical Market column, rows grouped by market
+            in the requested order and in date order within each market
+        """
+        markets = self.markets() if market is None else [market] if isinstance(market, str) else list(market)
+        markets = [m.upper() for m in markets]
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+
+        parts = [self._partition(m, start, end, columns) for m in markets]
+        lengths = [len(p) for p in parts]
+        df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0].reset_index(drop=True)
+        if columns is not None:
+            df = df.reindex(columns=['Date'] + [c for c in columns if c != 'Date'])
+        codes = np.repeat(np.arange(len(markets), dtype=np.int8), lengths)
+        df.insert(0, MARKET_COLUMN, pd.Categorical.from_codes(codes, categories=markets))
+        return df
+
+
+def _date_rows(dates: np.ndarray, start, end) -> slice:
+    """Row range of a date-sorted column within [start, end]"""
+    lo = 0 if start is None else int(np.searchsorted(dates, np.datetime64(start), side='left'))
+    hi = len(dates) if end is None else int(np.searchsorted(dates, np.datetime64(end), side='right'))
+    return slice(lo, max(hi, lo))
+
+
+def score_markets(
+    panel: pd.DataFrame,
+    models_dir: Optional[Path] = None,
+    train_cutoff: str = '2021-01-01',
+    predictor=None
+) -> pd.DataFrame:
+    """
+    Features and both models' predictions for every row of a multi-market frame
+
+    Runs FeatureEngineer once in panel mode (series_col='Market') and each
+    model once over the stacked rows of all markets, instead of once per market.
+
+    Args:
+        panel: Long-format frame from DataLoader.load (Market, Date, ...)
+        models_dir: Directory with the model artifacts (defaults to data/)
+        train_cutoff: Training-window end for the features (NaN inputs are filled
+            from the models' stored imputers, see fit_model_imputers)
+        predictor: ModelPredictor to reuse (defaults to one for models_dir)
+
+    Returns:
+        DataFrame with Market, Date, the direction columns of
+        batch_predict (direction, probability, confidence) and its level
+        columns (forecast, range_low, range_high, confidence_level), one row
+        per input row
+    """
+    from modules.feature_engineering import FeatureEngineer
+    from modules.models import load_models_from_dir
+    from modules.model_registry import DEFAULT_MODELS_DIR
+
+    engineer = FeatureEngineer(train_cutoff=train_cutoff, series_col=MARKET_COLUMN)
+    features = engineer.create_all_features(panel)
+    if predictor is None:
+        predictor = load_models_from_dir(Path(models_dir or DEFAULT_MODELS_DIR))
+
+    direction = predictor.batch_predict(features, 'nprs1', prediction_type='direction')
+    level = predictor.batch_predict(features, 'rf11', prediction_type='level')
+    result = pd.concat([
+        features[[MARKET_COLUMN, 'Date']].reset_index(drop=True),
+        direction,
+        level,
+    ], axis=1)
+    logger.info(f"Scored {len(result)} rows over {panel[MARKET_COLUMN].nunique()} markets")
+    return result
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    import shutil
+    import tempfile
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from modules.data_loader import DataLoader
+
+    print("Testing market store...")
+    root = Path(tempfile.mkdtemp())
+    loader = DataLoader(cache_dir=root / 'cache')
+    wti = loader.build_merged_data()
+
+    # Synthetic Brent and Dubai partitions in the merged_final.csv schema
+    loader.data_dir = root / 'data'
+    (loader.data_dir / 'markets').mkdir(parents=True)
+    for path in DataLoader().source_files:
+        shutil.copy(path, loader.data_dir / path.name)
+    rng = np.random.default_rng(5)
+    for market, premium in (('brent', 1.04), ('dubai', 0.98)):
+        other = wti.copy()
+        other['WTI'] = other['WTI'] * premium * rng.lognormal(0, 0.02, len(other))
+        other['Volatility'] = other['Volatility'] * rng.lognormal(0, 0.1, len(other))
+        other.to_csv(loader.data_dir / 'markets' / f'{market}.csv', index=False)
+
+    store = loader.markets
+    print(f"  markets: {store.markets()}")
+    start = time.perf_counter()
+    panel = loader.load(None)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    panel = loader.load(None)
+    warm = time.perf_counter() - start
+    print(f"  all markets, {len(panel)} rows: cold {cold * 1e3:.1f}ms, warm {warm * 1e3:.1f}ms")
+
+    # Pushdown returns exactly the filtered slice of the full partition
+    window = loader.load('brent', '2008-01-01', '2009-12-01', columns=['WTI', 'Volatility'])
+    full = panel[panel['Market'] == 'BRENT']
+    expected = full[(full['Date'] >= '2008-01-01') & (full['Date'] <= '2009-12-01')]
+    assert list(window.columns) == ['Market', 'Date', 'WTI', 'Volatility'] and len(window) == 24
+    np.testing.assert_allclose(window['WTI'], expected['WTI'])
+    pd.testing.assert_frame_equal(loader.load('WTI').drop(columns='Market'), wti)
+    # Loaded frames are writable (copy-on-write maps) and edits never reach the store
+    window.loc[0, 'WTI'] = 1.0
+    assert loader.load('brent', '2008-01-01', '2009-12-01')['WTI'].iat[0] == expected['WTI'].iat[0]
+    assert market_from_display('🇬🇧 TARGET_NODE_02: BRENT_CRUDE') == 'BRENT'
+    assert market_from_display('🇺🇸 United States (WTI)') == 'WTI'
+    assert market_from_display('🇬🇧 UKRAINE_SPREAD') == DEFAULT_MARKET
+    assert store.data_version('WTI') == loader.data_version != store.data_version('BRENT')
+
+    # One batched pass over all markets matches scoring each market on its own
+    from modules.models import load_models_from_dir
+    from modules.model_registry import DEFAULT_MODELS_DIR
+    predictor = load_models_from_dir(DEFAULT_MODELS_DIR)
+    score_markets(panel, predictor=predictor)
+    start = time.perf_counter()
+    scores = score_markets(panel, predictor=predictor)
+    batched = time.perf_counter() - start
+    start = time.perf_counter()
+    single = [score_markets(loader.load(m), predictor=predictor) for m in store.markets()]
+    looped = time.perf_counter() - start
+    single = pd.concat(single, ignore_index=True)
+    np.testing.assert_allclose(scores['forecast'], single['forecast'], rtol=1e-6)
+    print(f"  scoring {len(scores)} rows: batched {batched:.2f}s vs per market {looped:.2f}s")
+    print(scores.groupby('Market', observed=True).tail(1)[['Market', 'Date', 'direction', 'probability', 'forecast']]
+          .to_string(index=False))
+    shutil.rmtree(root, ignore_errors=True)
+    print("\n✅ Market store tests complete!")
@@ -0,0 +1,292 @@
+"""
+OVIP - Markov Switching Module
+Gaussian Markov-switching model with two or three regimes, in NumPy only:
+the Hamilton filter, the Kim smoother and EM (Baum-Welch) fitting. All
+recursions run in log space, so long samples and near-degenerate regimes do
+not underflow; emission densities are evaluated for every observation at once,
+each time step is one max-shifted K x K product, and the pairwise smoothed
+probabilities for the M-step are formed for all time steps in one expression.
+After fitting, update() folds in one new observation in O(K^2), so live regime
+probabilities refresh without refiltering the history.
+
+Regimes are ordered by their variance after fitting, so the last regime is
+the most turbulent (crisis) state.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LOG_2PI = np.log(2 * np.pi)
+
+
+def logsumexp(a: np.ndarray, axis: int = -1) -> np.ndarray:
+    """log(sum(exp(a))) along an axis, without overflow"""
+    peak = np.max(a, axis=axis, keepdims=True)
+    peak = np.where(np.isfinite(peak), peak, 0.0)
+    return np.squeeze(peak, axis=axis) + np.log(np.sum(np.exp(a - peak), axis=axis))
+
+
+def log_matvec(log_p: np.ndarray, matrix: np.ndarray, transpose: bool = False) -> np.ndarray:
+    """
+    log(exp(log_p) @ matrix) (or matrix @ exp(log_p) with transpose), stably
+
+    Shifting by the largest entry keeps the exponentials in range, so one
+    step costs a single K x K product instead of a K x K log-sum-exp.
+    """
+    peak = np.max(log_p)
+    scaled = np.exp(log_p - peak)
+    with np.errstate(divide='ignore'):
+        return peak + np.log(matrix @ scaled if transpose else scaled @ matrix)
+
+
+@dataclass
+class FilterResult:
+    """Log-probabilities from one pass of the Hamilton filter"""
+    log_filtered: np.ndarray   # (T, K) log P(s_t | y_1..t)
+    log_predicted: np.ndarray  # (T, K) log P(s_t | y_1..t-1)
+    log_likelihood: float
+
+    @property
+    def filtered(self) -> np.ndarray:
+        return np.exp(self.log_filtered)
+
+
+class MarkovSwitchingModel:
+    """Univariate Gaussian Markov-switching model with regime-dependent mean and variance"""
+
+    def __init__(
+        self,
+        n_regimes: int = 2,
+        switching_mean: bool = True,
+        max_iter: int = 200,
+        tol: float = 1e-6
+    ):
+        """
+        Args:
+            n_regimes: Number of regimes (2 or 3)
+            switching_mean: Let the mean switch with the regime (otherwise only the variance does)
+            max_iter: Maximum EM iterations
+            tol: Stop when the log-likelihood improves by less than this
+        """
+        if n_regimes not in (2, 3):
+            raise ValueError("n_regimes must be 2 or 3")
+        self.n_regimes = n_regimes
+        self.switching_mean = switching_mean
+        self.max_iter = max_iter
+        self.tol = tol
+
+        self.means: Optional[np.ndarray] = None
+        self.variances: Optional[np.ndarray] = None
+        self.transition: Optional[np.ndarray] = None
+        self.initial: Optional[np.ndarray] = None
+        self.log_likelihood = -np.inf
+        self.n_iter = 0
+        self._log_filtered_last: Optional[np.ndarray] = None
+
+    # -- densities and recursions ------------------------------------------
+
+    def _log_emissions(self, y: np.ndarray) -> np.ndarray:
+        """
+        (T, K) log N(y_t; mu_k, sigma_k^2) for every observation and regime
+
+        Missing observations (NaN) carry no information: their log emission
+        is 0 in every regime, so the filter only applies the transition step.
+        """
+        resid = y[:, np.newaxis] - self.means
+        log_density = -0.5 * (LOG_2PI + np.log(self.variances) + resid ** 2 / self.variances)
+        return np.where(np.isnan(resid), 0.0, log_density)
+
+    def _hamilton_filter(self, log_emissions: np.ndarray) -> FilterResult:
+        n_obs, k = log_emissions.shape
+        log_filtered = np.empty((n_obs, k))
+        log_predicted = np.empty((n_obs, k))
+        log_likelihood = 0.0
+
+        prior = np.log(self.initial)
+        for t in range(n_obs):
+            if t:
+                prior = log_matvec(log_filtered[t - 1], self.transition)
+            log_predicted[t] = prior
+            joint = prior + log_emissions[t]
+            peak = joint.max()
+            norm = peak + np.log(np.exp(joint - peak).sum())
+            log_filtered[t] = joint - norm
+            log_likelihood += norm
+        return FilterResult(log_filtered, log_predicted, float(log_likelihood))
+
+    def _kim_smoother(self, result: FilterResult, log_transition: np.ndarray):
+        """Smoothed log P(s_t | y_1..T) and the pairwise log P(s_t, s_t+1 | y_1..T)"""
+        log_filtered, log_predicted = result.log_filtered, result.log_predicted
+        log_smoothed = np.empty_like(log_filtered)
+        log_smoothed[-1] = log_filtered[-1]
+        for t in range(len(log_filtered) - 2, -1, -1):
+            ratio = log_smoothed[t + 1] - log_predicted[t + 1]
+            log_smoothed[t] = log_filtered[t] + log_matvec(ratio, self.transition, transpose=True)
+
+        log_pairs = (
+            log_filtered[:-1, :, np.newaxis]
+            + log_transition
+            + (log_smoothed[1:] - log_predicted[1:])[:, np.newaxis, :]
+        )
+        return log_smoothed, log_pairs
+
+    # -- fitting -------------------------------------------------------------
+
+    def _initialize(self, y: np.ndarray):
+        k = self.n_regimes
+        # Regimes start at the quantile bands of the series: calm low, crisis high
+        edges = np.quantile(y, np.linspace(0, 1, k + 1))
+        bands = np.clip(np.searchsorted(edges[1:-1], y, side='right'), 0, k - 1)
+        self.means = np.array([y[bands == j].mean() for j in range(k)])
+        spread = np.array([y[bands == j].var() for j in range(k)])
+        self.variances = np.maximum(spread, 1e-3 * y.var())
+        if not self.switching_mean:
+            self.means = np.full(k, y.mean())
+            self.variances = y.var() * np.linspace(0.5, 2.0, k)
+        self.transition = np.full((k, k), 0.05 / (k - 1))
+        np.fill_diagonal(self.transition, 0.95)
+        self.initial = np.full(k, 1.0 / k)
+
+    def fit(self, y) -> 'MarkovSwitchingModel':
+        """
+        Fit by expectation-maximization
+
+        Args:
+            y: Observation series (NaNs are dropped)
+
+        Returns:
+            self, with regimes ordered by increasing variance (then mean)
+        """
+        y = np.asarray(y, dtype=float)
+        y = y[~np.isnan(y)]
+        if len(y) < 10 * self.n_regimes:
+            raise ValueError(f"Need at least {10 * self.n_regimes} observations to fit {self.n_regimes} regimes")
+
+        self._initialize(y)
+        variance_floor = 1e-6 * y.var()
+        previous = -np.inf
+        for iteration in range(1, self.max_iter + 1):
+            with np.errstate(divide='ignore'):
+                log_transition = np.log(self.transition)
+            result = self._hamilton_filter(self._log_emissions(y))
+            log_smoothed, log_pairs = self._kim_smoother(result, log_transition)
+            smoothed = np.exp(log_smoothed)
+            pairs = np.exp(log_pairs).sum(axis=0)
+
+            # M-step: closed-form updates weighted by the smoothed probabilities
+            weight = smoothed.sum(axis=0)
+            self.initial = np.clip(smoothed[0], 1e-12, None)
+            self.initial /= self.initial.sum()
+            self.transition = pairs / pairs.sum(axis=1, keepdims=True)
+            if self.switching_mean:
+                self.means = smoothed.T @ y / weight
+            else:
+                self.means = np.full(self.n_regimes, y.mean())
+            resid = (y[:, np.newaxis] - self.means) ** 2
+            self.variances = np.maximum((smoothed * resid).sum(axis=0) / weight, variance_floor)
+
+            self.log_likelihood = result.log_likelihood
+            self.n_iter = iteration
+            if result.log_likelihood - previous < self.tol:
+                break
+            previous = result.log_likelihood
+
+        self._order_regimes()
+        self._log_filtered_last = self.filter(y).log_filtered[-1]
+        logger.info(f"Markov switching fit: {self.n_regimes} regimes, {self.n_iter} EM iterations, "
+                    f"log-likelihood {self.log_likelihood:.2f}")
+        return self
+
+    def _order_regimes(self):
+        order = np.lexsort((self.means, self.variances))
+        self.means = self.means[order]
+        self.variances = self.variances[order]
+        self.initial = self.initial[order]
+        self.transition = self.transition[np.ix_(order, order)]
+
+    # -- inference -----------------------------------------------------------
+
+    def filter(self, y) -> FilterResult:
+        """Hamilton filter over a series with the fitted parameters"""
+        y = np.asarray(y, dtype=float)
+        return self._hamilton_filter(self._log_emissions(y))
+
+    def smooth(self, y) -> np.ndarray:
+        """Kim-smoothed regime probabilities, shape (T, K)"""
+        y = np.asarray(y, dtype=float)
+        with np.errstate(divide='ignore'):
+            log_transition = np.log(self.transition)
+        log_smoothed, _ = self._kim_smoother(self._hamilton_filter(self._log_emissions(y)), log_transition)
+        return np.exp(log_smoothed)
+
+    def update(self, value: float) -> np.ndarray:
+        """
+        Filtered regime probabilities after one more observation, in O(K^2)
+
+        The filter state continues from the end of the fitted series (or the
+        previous update), so repeated calls follow a live feed. A NaN value
+        (missing month) only advances the regime probabilities one transition.
+        """
+        if self._log_filtered_last is None:
+            raise RuntimeError("Model must be fitted before update()")
+        prior = log_matvec(self._log_filtered_last, self.transition)
+        joint = prior + self._log_emissions(np.array([value], dtype=float))[0]
+        self._log_filtered_last = joint - logsumexp(joint)
+        return np.exp(self._log_filtered_last)
+
+    @property
+    def expected_durations(self) -> np.ndarray:
+        """Expected months spent in each regime per visit, 1 / (1 - p_kk)"""
+        return 1.0 / (1.0 - np.diag(self.transition))
+
+
+if __name__ == '__main__':
+    import time
+
+    print("Testing Markov switching model...")
+    rng = np.random.default_rng(7)
+    truth = np.zeros(600, dtype=int)
+    for t in range(1, len(truth)):
+        stay = 0.97 if truth[t - 1] == 0 else 0.9
+        truth[t] = truth[t - 1] if rng.random() < stay else 1 - truth[t - 1]
+    y = np.where(truth == 1, rng.normal(1.0, 0.6, len(truth)), rng.normal(-0.5, 0.25, len(truth)))
+
+    start = time.perf_counter()
+    model = MarkovSwitchingModel(n_regimes=2).fit(y)
+    print(f"  fit: {time.perf_counter() - start:.2f}s, {model.n_iter} iterations")
+    print(f"  means {np.round(model.means, 3)}, std {np.round(np.sqrt(model.variances), 3)}, "
+          f"durations {np.round(model.expected_durations, 1)}")
+    smoothed = model.smooth(y)
+    accuracy = np.mean((smoothed[:, 1] > 0.5) == truth)
+    print(f"  smoothed regime accuracy: {accuracy:.1%}")
+    assert accuracy > 0.9
+
+    # update() continues the filter exactly
+    head, tail = y[:-50], y[-50:]
+    online = MarkovSwitchingModel(n_regimes=2).fit(y)
+    online._log_filtered_last = online.filter(head).log_filtered[-1]
+    start = time.perf_counter()
+    live = np.array([online.update(v) for v in tail])
+    per_update = (time.perf_counter() - start) / len(tail)
+    np.testing.assert_allclose(live, online.filter(y).filtered[-50:], atol=1e-12)
+    print(f"  update: {per_update * 1e6:.0f}µs per observation, matches the batch filter")
+
+    # Missing observations skip the update step instead of poisoning the filter
+    gappy = y.copy()
+    gappy[[100, 101, 350]] = np.nan
+    filtered = model.filter(gappy).filtered
+    assert np.isfinite(filtered).all() and np.isfinite(model.smooth(gappy)).all()
+    np.testing.assert_allclose(filtered[101], model.filter(gappy[:100]).filtered[-1] @ np.linalg.matrix_power(model.transition, 2))
+    online = MarkovSwitchingModel(n_regimes=2).fit(y)
+    online.update(np.nan)
+    assert np.isfinite(online.update(y[-1])).all()
+    print("  NaN observations: filter, smoother and update stay finite")
+
+    three = MarkovSwitchingModel(n_regimes=3).fit(y)
+    print(f"  3 regimes: means {np.round(three.means, 3)}")
+    print("\n✅ Markov switching tests complete!")
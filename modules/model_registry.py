@@ -0,0 +1,336 @@
+"""
+OVIP - Model Registry Module
+Binds every model to a precompiled feature schema: the model's feature names
+(read from the artifact, so they always match what the model was trained on),
+their column indices in a shared feature matrix, the input dtype and the
+imputation values. A feature frame is converted once into one contiguous
+float32 matrix holding the union of all models' columns, and each model takes
+its columns from it by precomputed index instead of re-validating and
+re-slicing the DataFrame by name on every call.
+
+Missing inputs are imputed with per-feature medians of the training window
+(FeatureImputer), computed once and stored next to the model artifact, so
+single-row and batch scoring fill NaNs with the same values.
+"""
+
+import os
+import json
+import logging
+import tempfile
+import threading
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from modules.model_store import ModelStore
+
+logger = logging.getLogger(__name__)
+
+# Feature lists for models that do not record their feature names (e.g. unfitted dummies)
+DEFAULT_FEATURES = {
+    'nprs1': ('L_Vol', 'L_Regime', 'L_Inten', 'L_GPR', 'L_Accel'),
+    'rf11': (
+        'L_Vol', 'L_Regime', 'L_Inten', 'L_WTI_Ret', 'L_GPR',
+        'L_Accel', 'L_News_Shk', 'L_MS_Vol_Safe',
+        'L_State_S_Safe', 'L_Crowd_Safe', 'L_Vol_Std'
+    ),
+}
+
+DEFAULT_MODELS_DIR = Path(__file__).resolve().parent.parent / 'data'
+
+IMPUTER_SUFFIX = '.imputer.json'
+
+
+class FeatureImputer:
+    """Per-feature medians of the training window, used to fill missing model inputs"""
+
+    def __init__(self, medians: Dict[str, float], train_cutoff: Optional[str] = None, n_rows: int = 0):
+        """
+        Args:
+            medians: Feature name -> training-window median
+            train_cutoff: End (exclusive) of the training window the medians come from
+            n_rows: Number of training rows they were computed over
+        """
+        self.medians = medians
+        self.train_cutoff = train_cutoff
+        self.n_rows = n_rows
+
+    @classmethod
+    def fit(
+        cls,
+        df: pd.DataFrame,
+        features: Sequence[str],
+        train_cutoff: Union[str, pd.Timestamp]
+    ) -> 'FeatureImputer':
+        """
+        Medians over the rows before train_cutoff (FeatureEngineer.train_cutoff)
+
+        Frames without a Date column use their first half, as FeatureEngineer does.
+        """
+        if 'Date' in df.columns:
+            train = df.loc[df['Date'] < pd.Timestamp(train_cutoff)]
+        else:
+            train = df.iloc[:len(df)//2]
+        columns = [f for f in features if f in train.columns]
+        medians = train[columns].median()
+        return cls(
+            {name: float(value) for name, value in medians.items() if pd.notna(value)},
+            str(pd.Timestamp(train_cutoff).date()),
+            len(train),
+        )
+
+    def values(self, features: Sequence[str]) -> np.ndarray:
+        """Medians in feature order (NaN where the training window had none)"""
+        return np.array([self.medians.get(f, np.nan) for f in features], dtype=np.float32)
+
+    def save(self, path: Path):
+        path = Path(path)
+        record = {'train_cutoff': self.train_cutoff, 'n_rows': self.n_rows, 'medians': self.medians}
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-', suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(record, f, indent=2)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> 'FeatureImputer':
+        with open(path) as f:
+            record = json.load(f)
+        return cls(record['medians'], record.get('train_cutoff'), record.get('n_rows', 0))
+
+
+def imputer_path(model_path: Path) -> Path:
+    """Where the imputer of a model artifact is stored (next to it)"""
+    model_path = Path(model_path)
+    return model_path.with_name(model_path.stem + IMPUTER_SUFFIX)
+
+
+@dataclass
+class FeatureMatrix:
+    """A feature frame converted once to float32, shared by every model"""
+    columns: Tuple[str, ...]
+    values: np.ndarray
+    present: np.ndarray
+
+    @property
+    def n_rows(self) -> int:
+        return self.values.shape[0]
+
+
+@dataclass(frozen=True)
+class FeatureSchema:
+    """Precompiled inputs of one model"""
+    model_name: str
+    features: Tuple[str, ...]
+    indices: np.ndarray
+    impute_values: np.ndarray
+    dtype: type = np.float32
+
+    def missing(self, matrix: FeatureMatrix) -> List[str]:
+        """Model features absent from the frame the matrix was built from"""
+        absent = ~matrix.present[self.indices]
+        return [self.features[i] for i in np.flatnonzero(absent)]
+
+    def take(self, matrix: FeatureMatrix) -> np.ndarray:
+        """The model's input matrix, columns in training order"""
+        return matrix.values[:, self.indices]
+
+    @property
+    def has_impute_values(self) -> bool:
+        return not np.isnan(self.impute_values).all()
+
+    def impute(self, X: np.ndarray) -> np.ndarray:
+        """Replace NaNs in an input matrix from take() with the impute values, column by column"""
+        return np.where(np.isnan(X), self.impute_values, X).astype(self.dtype, copy=False)
+
+
+class ModelRegistry:
+    """Feature schemas per model name, plus the shared feature matrix they index into"""
+
+    def __init__(self, store: Optional[ModelStore] = None):
+        """
+        Args:
+            store: Model store to read schemas from for models never bound explicitly
+        """
+        self.store = store
+        self.columns: List[str] = []
+        self._column_index: Dict[str, int] = {}
+        self._schemas: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _compile(self, name: str, features: Sequence[str], model) -> FeatureSchema:
+        # Columns are only ever appended, so indices of earlier schemas stay valid
+        for feature in features:
+            if feature not in self._column_index:
+                self._column_index[feature] = len(self.columns)
+                self.columns.append(feature)
+        schema = FeatureSchema(
+            model_name=name,
+            features=tuple(features),
+            indices=np.array([self._column_index[f] for f in features], dtype=np.intp),
+            impute_values=np.full(len(features), np.nan, dtype=np.float32),
+        )
+        self._schemas[name] = (model, schema)
+        return schema
+
+    def bind(self, name: str, model) -> FeatureSchema:
+        """
+        Compile the schema of a (newly loaded) model
+
+        Feature names come from the model's feature_names_in_; models without
+        them fall back to DEFAULT_FEATURES.
+        """
+        names = getattr(model, 'feature_names_in_', None)
+        if names is not None:
+            features = [str(n) for n in names]
+        elif name in DEFAULT_FEATURES:
+            features = list(DEFAULT_FEATURES[name])
+        else:
+            raise KeyError(f"Model '{name}' records no feature names and has no default feature list")
+        with self._lock:
+            return self._compile(name, features, model)
+
+    def schema(self, name: str) -> FeatureSchema:
+        """
+        Schema of a model, from its bound model, the store artifact or the default list
+
+        A bound model is used until the store reports its artifact swapped;
+        models loaded from elsewhere (an explicit pickle) keep their binding.
+        """
+        bound = self._schemas.get(name)
+        if bound is not None and bound[0] is not None and not (self.store is not None and self.store.is_stale(name)):
+            return bound[1]
+        model = None
+        if self.store is not None:
+            try:
+                model = self.store.get(name)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"Could not read the schema of {name} from the model store: {e}")
+
+        if model is not None:
+            if bound is not None and bound[0] is model:
+                return bound[1]
+            return self.bind(name, model)
+        if bound is not None:
+            return bound[1]
+        return self.bind(name, None)
+
+    def attach_imputer(self, name: str, imputer: FeatureImputer) -> FeatureSchema:
+        """Set a bound model's impute values from an imputer"""
+        with self._lock:
+            model, schema = self._schemas[name]
+            schema = replace(schema, impute_values=imputer.values(schema.features))
+            self._schemas[name] = (model, schema)
+            return schema
+
+    def feature_names(self, name: str) -> List[str]:
+        """
+        Input features of a model, without loading it
+
+        Taken from the bound schema, else the store manifest, else
+        DEFAULT_FEATURES.
+        """
+        bound = self._schemas.get(name)
+        if bound is not None:
+            return list(bound[1].features)
+        features = self.store.feature_names(name) if self.store is not None else None
+        if features is None and name in DEFAULT_FEATURES:
+            features = list(DEFAULT_FEATURES[name])
+        if features is None:
+            raise KeyError(f"Model '{name}' records no feature names and has no default feature list")
+        return features
+
+    def matrix(self, features: pd.DataFrame, last_row: bool = False) -> FeatureMatrix:
+        """
+        Float32 matrix of every registered column for a feature frame
+
+        Converted on every call: frames can be edited in place, so a reused
+        conversion could be stale.
+
+        Args:
+            features: Feature frame
+            last_row: Convert only the latest row (single-row scoring)
+        """
+        rows = features.iloc[-1:] if last_row else features
+        present = np.array([c in features.columns for c in self.columns], dtype=bool)
+        values = rows.reindex(columns=self.columns).to_numpy(dtype=np.float32)
+        return FeatureMatrix(tuple(self.columns), np.ascontiguousarray(values), present)
+
+
+_registries: Dict[Path, ModelRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_model_registry(models_dir: Optional[Path] = None) -> ModelRegistry:
+    """Process-wide registry for a models directory (defaults to data/)"""
+    models_dir = Path(models_dir or DEFAULT_MODELS_DIR).resolve()
+    with _registries_lock:
+        if models_dir not in _registries:
+            _registries[models_dir] = ModelRegistry(ModelStore(models_dir))
+        return _registries[models_dir]
+
+
+if __name__ == '__main__':
+    import time
+
+    print("Testing model registry...")
+    registry = get_model_registry()
+    names = {}
+    for name in ('nprs1', 'rf11'):
+        names[name] = registry.feature_names(name)
+        print(f"  {name}: {names[name]}")
+    # Feature names come from the manifest: nothing was loaded or bound
+    assert not registry.store._loaded and not registry.columns
+
+    rng = np.random.default_rng(0)
+    columns = list(dict.fromkeys(names['nprs1'] + names['rf11']))
+    frame = pd.DataFrame(rng.normal(size=(300, len(columns) + 3)),
+                         columns=columns + ['Date_Ord', 'WTI', 'Volatility'])
+    for name in ('nprs1', 'rf11'):
+        schema = registry.schema(name)
+        assert list(schema.features) == names[name]
+        matrix = registry.matrix(frame)
+        assert not schema.missing(matrix)
+        np.testing.assert_array_equal(schema.take(matrix), frame[list(schema.features)].to_numpy(np.float32))
+
+    # In-place edits and swapped columns are picked up by the next conversion
+    schema = registry.schema('rf11')
+    edited = frame.copy()
+    registry.matrix(edited, last_row=True)
+    edited.iloc[-1, edited.columns.get_loc(schema.features[0])] = 42.0
+    assert schema.take(registry.matrix(edited, last_row=True))[0, 0] == 42.0
+    edited = edited.drop(columns=schema.features[1]).assign(Extra=0.0)
+    assert schema.missing(registry.matrix(edited)) == [schema.features[1]]
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        for name in ('nprs1', 'rf11'):
+            features = list(registry.schema(name).features)
+            missing = [f for f in features if f not in frame.columns]
+            frame[features].iloc[[-1]].to_numpy(np.float32)
+    legacy = (time.perf_counter() - start) / 1000
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        matrix = registry.matrix(frame, last_row=True)
+        for name in ('nprs1', 'rf11'):
+            schema = registry.schema(name)
+            schema.missing(matrix)
+            schema.take(matrix)
+    shared = (time.perf_counter() - start) / 1000
+    print(f"  last-row inputs for both models: {legacy * 1e3:.3f}ms per-model slicing -> {shared * 1e3:.3f}ms shared")
+
+    # Imputation uses training-window medians only, and fills a single NaN row
+    frame['Date'] = pd.date_range('2000-01-01', periods=len(frame), freq='MS')
+    schema = registry.schema('rf11')
+    imputer = FeatureImputer.fit(frame, schema.features, '2010-01-01')
+    expected = frame.loc[frame['Date'] < '2010-01-01', list(schema.features)].median().to_numpy(np.float32)
+    np.testing.assert_array_equal(imputer.values(schema.features), expected)
+    schema = registry.attach_imputer('rf11', imputer)
+    row = np.full((1, len(schema.features)), np.nan, dtype=np.float32)
+    np.testing.assert_array_equal(schema.impute(row)[0], expected)
+    print("\n✅ Model registry tests complete!")
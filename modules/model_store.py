@@ -0,0 +1,382 @@
+"""
+OVIP - Model Artifact Store
+Keeps the trained forests in a flat, array-based format: one .npy file per node
+attribute (feature, threshold, children, value) for all trees, memory-mapped on
+load. Pages in a worker are only touched when scored, and the page cache is
+shared between processes, so cold start and per-worker RSS are a fraction of
+unpickling the full scikit-learn estimators.
+
+A manifest (data/model_manifest.json) maps model names to their source pickle
+and the feature names it was trained on.
+Flat artifacts are exported from the pickle on first use into the cache
+directory, keyed by the pickle's size and mtime. When the manifest or the pickle
+changes, the next lookup picks up the new model without a process restart.
+The scikit-learn estimator itself is only unpickled on request (estimator()),
+for large batches where its compiled per-tree loops outrun the flat walk.
+"""
+
+import os
+import json
+import shutil
+import pickle
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from modules.data_cache import default_cache_dir, signature_key
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'model_manifest.json'
+
+# Arrays written per artifact; all node arrays are indexed by global node id
+NODE_ARRAYS = ('feature', 'threshold', 'left', 'right', 'missing_left', 'value')
+
+# Bumped when the artifact layout changes, so older exports are not reused
+ARTIFACT_FORMAT = 2
+
+# Exported versions kept per model, so swapping back does not re-export
+KEEP_VERSIONS = 2
+
+
+class FlatForest:
+    """
+    Random Forest flattened into contiguous node arrays
+
+    Node ids are global across trees (tree t owns ids tree_offsets[t] to
+    tree_offsets[t + 1] - 1). Leaves point to themselves in left/right, so a
+    traversal can step every row a fixed number of times (the tree depth)
+    without masking. missing_left is the direction scikit-learn sends NaN
+    inputs at each split. For classifiers value holds the normalized class
+    probabilities of each node, for regressors the node mean.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.missing_left = arrays['missing_left']
+        self.value = arrays['value']
+        self.tree_offsets = arrays['tree_offsets']
+        self.tree_depths = arrays['tree_depths']
+        self.feature_importances_ = arrays['feature_importances']
+
+        self.meta = meta
+        self.kind = meta['kind']
+        self.n_features_in_ = meta['n_features']
+        self.feature_names_in_ = np.array(meta['feature_names'], dtype=object) if meta['feature_names'] else None
+        self.classes_ = np.array(meta['classes']) if meta['classes'] is not None else None
+        self.n_trees = len(self.tree_depths)
+
+        # Per-node output used for tree-spread intervals (positive-class probability for classifiers)
+        self.node_output = self.value[:, -1] if self.kind == 'classifier' else self.value[:, 0]
+
+    @property
+    def is_classifier(self) -> bool:
+        return self.kind == 'classifier'
+
+    @classmethod
+    def from_sklearn(cls, model) -> 'FlatForest':
+        """Flatten a fitted RandomForestClassifier or RandomForestRegressor"""
+        is_classifier = isinstance(model, RandomForestClassifier)
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        counts = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        feature, threshold, left, right, missing_left, value = [], [], [], [], [], []
+        for tree, offset in zip(trees, offsets[:-1]):
+            ids = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left == -1
+            feature.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(np.where(is_leaf, ids, tree.children_left + offset).astype(np.int32))
+            right.append(np.where(is_leaf, ids, tree.children_right + offset).astype(np.int32))
+            missing_left.append(np.asarray(tree.missing_go_to_left, dtype=bool))
+
+            node_value = tree.value[:, 0, :]
+            if is_classifier:
+                # Same normalization as DecisionTreeClassifier.predict_proba
+                normalizer = node_value.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                node_value = node_value / normalizer
+            value.append(node_value)
+
+        arrays = {
+            'feature': np.concatenate(feature),
+            'threshold': np.concatenate(threshold),
+            'left': np.concatenate(left),
+            'right': np.concatenate(right),
+            'missing_left': np.concatenate(missing_left),
+            'value': np.ascontiguousarray(np.concatenate(value)),
+            'tree_offsets': offsets,
+            'tree_depths': np.array([tree.max_depth for tree in trees], dtype=np.int32),
+            'feature_importances': np.asarray(model.feature_importances_, dtype=float),
+        }
+        names = getattr(model, 'feature_names_in_', None)
+        meta = {
+            'kind': 'classifier' if is_classifier else 'regressor',
+            'n_features': int(model.n_features_in_),
+            'feature_names': [str(n) for n in names] if names is not None else None,
+            'classes': model.classes_.tolist() if is_classifier else None,
+        }
+        return cls(arrays, meta)
+
+    def save(self, directory: Path):
+        """Write the arrays and metadata atomically to directory"""
+        directory = Path(directory)
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(dir=directory.parent, prefix='.tmp-'))
+
+        arrays = {name: getattr(self, name) for name in NODE_ARRAYS}
+        arrays.update(tree_offsets=self.tree_offsets, tree_depths=self.tree_depths,
+                      feature_importances=self.feature_importances_)
+        for name, array in arrays.items():
+            np.save(tmp_dir / f"{name}.npy", np.ascontiguousarray(array))
+        with open(tmp_dir / 'meta.json', 'w') as f:
+            json.dump(self.meta, f)
+
+        try:
+            os.rename(tmp_dir, directory)
+        except OSError:
+            # Another worker exported the same artifact first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> 'FlatForest':
+        """Load an artifact written by save(), memory-mapped by default"""
+        directory = Path(directory)
+        with open(directory / 'meta.json') as f:
+            meta = json.load(f)
+        names = NODE_ARRAYS + ('tree_offsets', 'tree_depths', 'feature_importances')
+        arrays = {name: np.load(directory / f"{name}.npy", mmap_mode='r' if mmap else None) for name in names}
+        return cls(arrays, meta)
+
+    def _validate(self, X) -> np.ndarray:
+        """Input as a float32 matrix, checked like scikit-learn checks it"""
+        if isinstance(X, pd.DataFrame) and self.feature_names_in_ is not None:
+            if list(X.columns) != list(self.feature_names_in_):
+                raise ValueError(
+                    f"The feature names should match those that were passed during fit: "
+                    f"expected {list(self.feature_names_in_)}, got {list(X.columns)}"
+                )
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[-1]} features, but the model expects {self.n_features_in_}")
+        return X
+
+    def apply_tree(self, t: int, X: np.ndarray) -> np.ndarray:
+        """Global leaf ids of tree t for a validated float32 matrix"""
+        rows = np.arange(X.shape[0])
+        node = np.full(X.shape[0], self.tree_offsets[t], dtype=np.intp)
+        for _ in range(self.tree_depths[t]):
+            x = X[rows, self.feature[node]]
+            go_left = (x <= self.threshold[node]) | (np.isnan(x) & self.missing_left[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def _tree_sum(self, X) -> np.ndarray:
+        X = self._validate(X)
+        total = np.zeros((X.shape[0], self.value.shape[1]))
+        # Trees are accumulated in order, as scikit-learn does
+        for t in range(self.n_trees):
+            total += self.value[self.apply_tree(t, X)]
+        return total / self.n_trees
+
+    def predict_proba(self, X) -> np.ndarray:
+        if not self.is_classifier:
+            raise AttributeError("predict_proba is only available for classifiers")
+        return self._tree_sum(X)
+
+    def predict(self, X) -> np.ndarray:
+        if self.is_classifier:
+            return self.classes_.take(np.argmax(self._tree_sum(X), axis=1))
+        return self._tree_sum(X)[:, 0]
+
+
+class ModelStore:
+    """Manifest-driven, lazily loaded flat model artifacts with hot-swap"""
+
+    def __init__(
+        self,
+        models_dir: Path,
+        manifest_path: Optional[Path] = None,
+        cache_dir: Optional[Path] = None
+    ):
+        """
+        Args:
+            models_dir: Directory holding the model pickles and the manifest
+            manifest_path: Manifest file (defaults to models_dir/model_manifest.json)
+            cache_dir: Where flat artifacts are exported (defaults to <cache>/models)
+        """
+        self.models_dir = Path(models_dir)
+        self.manifest_path = Path(manifest_path) if manifest_path else self.models_dir / MANIFEST_NAME
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir() / 'models'
+
+        self._manifest: Dict[str, Dict] = {}
+        self._manifest_signature = None
+        self._loaded: Dict[str, tuple] = {}
+        self._estimators: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def manifest(self) -> Dict[str, Dict]:
+        """Name -> entry mapping, re-read whenever the manifest file changes"""
+        signature = signature_key([self.manifest_path]) if self.manifest_path.exists() else None
+        if signature != self._manifest_signature:
+            if signature is None:
+                self._manifest = {}
+            else:
+                with open(self.manifest_path) as f:
+                    self._manifest = json.load(f)
+            self._manifest_signature = signature
+        return self._manifest
+
+    @property
+    def models_version(self) -> str:
+        """Hash of the manifest and every registered pickle; changes on any swap or retrain"""
+        sources = [self.manifest_path] if self.manifest_path.exists() else []
+        sources += [p for p in (self.models_dir / e['file'] for e in self.manifest.values()) if p.exists()]
+        return signature_key(sources)
+
+    def source_path(self, name: str) -> Path:
+        """Pickle registered for a model name"""
+        entry = self.manifest.get(name)
+        if entry is None:
+            raise FileNotFoundError(f"Model '{name}' is not in {self.manifest_path}")
+        return self.models_dir / entry['file']
+
+    def feature_names(self, name: str) -> Optional[List[str]]:
+        """Feature names recorded in a model's manifest entry (None if not recorded)"""
+        features = self.manifest.get(name, {}).get('features')
+        return list(features) if features is not None else None
+
+    def _source_key(self, name: str) -> str:
+        return signature_key([self.source_path(name)])
+
+    def is_stale(self, name: str) -> bool:
+        """True if the model was loaded and its manifest entry or pickle has changed since"""
+        loaded = self._loaded.get(name)
+        if loaded is None:
+            return False
+        try:
+            return self._source_key(name) != loaded[0]
+        except FileNotFoundError:
+            return True
+
+    def get(self, name: str) -> FlatForest:
+        """
+        Flat artifact for a model, exported from its pickle on first use
+
+        Raises:
+            FileNotFoundError if the model is not registered or its file is missing
+        """
+        key = self._source_key(name)
+        loaded = self._loaded.get(name)
+        if loaded is not None and loaded[0] == key:
+            return loaded[1]
+
+        with self._lock:
+            entry = self.cache_dir / name / f"{key}.v{ARTIFACT_FORMAT}"
+            if not entry.exists():
+                source = self.source_path(name)
+                logger.info(f"Exporting {name} from {source} to {entry}")
+                with open(source, 'rb') as f:
+                    FlatForest.from_sklearn(pickle.load(f)).save(entry)
+                self._prune(name, keep=entry.name)
+
+            forest = FlatForest.load(entry)
+            self._loaded[name] = (key, forest)
+            logger.info(f"Loaded model: {name} ({forest.n_trees} trees, {len(forest.feature)} nodes) from {entry}")
+            return forest
+
+    def estimator(self, name: str):
+        """
+        The scikit-learn model behind a name, unpickled on first use and kept until its pickle changes
+
+        Raises:
+            FileNotFoundError if the model is not registered or its file is missing
+        """
+        key = self._source_key(name)
+        loaded = self._estimators.get(name)
+        if loaded is not None and loaded[0] == key:
+            return loaded[1]
+        with open(self.source_path(name), 'rb') as f:
+            model = pickle.load(f)
+        self._estimators[name] = (key, model)
+        return model
+
+    def swap(self, name: str, model_file: Path):
+        """Point a model name at another pickle (in models_dir); the next get() loads it"""
+        with open(self.models_dir / Path(model_file).name, 'rb') as f:
+            names = getattr(pickle.load(f), 'feature_names_in_', None)
+        entry = {'file': Path(model_file).name}
+        if names is not None:
+            entry['features'] = [str(n) for n in names]
+        with self._lock:
+            manifest = dict(self.manifest)
+            manifest[name] = entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.manifest_path.parent, prefix='.tmp-', suffix='.json')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+        logger.info(f"Swapped {name} -> {model_file}")
+
+    def _prune(self, name: str, keep: str):
+        entries = [p for p in (self.cache_dir / name).iterdir() if p.name != keep and not p.name.startswith('.tmp-')]
+        for old in sorted(entries, key=lambda p: p.stat().st_mtime, reverse=True)[KEEP_VERSIONS - 1:]:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    import subprocess
+    import warnings
+
+    warnings.filterwarnings('ignore')
+    data_dir = Path(__file__).resolve().parent.parent / 'data'
+
+    print("Testing FlatForest parity...")
+    rng = np.random.default_rng(42)
+    store = ModelStore(data_dir)
+    for name in store.manifest:
+        with open(store.source_path(name), 'rb') as f:
+            model = pickle.load(f)
+        forest = store.get(name)
+        X = pd.DataFrame(rng.normal(0, 1, (2000, model.n_features_in_)) * [0.1, 1, 100, 0.1, 100, 0.1, 0.1, 0.1, 0.1, 0.1],
+                         columns=model.feature_names_in_)
+        X.iloc[::7, 0] = np.nan  # missing inputs follow each split's missing-value direction
+        if forest.is_classifier:
+            assert np.array_equal(forest.predict_proba(X), model.predict_proba(X))
+        assert np.array_equal(forest.predict(X), model.predict(X))
+        assert store.feature_names(name) == list(model.feature_names_in_)
+        print(f"  {name}: identical to sklearn on {len(X)} rows (with NaNs)")
+
+    print("\nCold start per worker (fresh interpreter, both models):")
+    probe = (
+        "import time, pickle, warnings, sys; warnings.filterwarnings('ignore'); sys.path.insert(0, {root!r})\n"
+        "from pathlib import Path\n"
+        "from modules.model_store import ModelStore\n"
+        "def rss(): return int(open('/proc/self/statm').read().split()[1]) * 4096 / 2**20\n"
+        "store = ModelStore(Path({data!r})); before = rss(); start = time.perf_counter()\n"
+        "for name in store.manifest:\n"
+        "    {load}\n"
+        "print(f'{{time.perf_counter() - start:.3f}} {{rss() - before:.1f}}')\n"
+    )
+    loads = {
+        'pickle': "pickle.load(open(store.source_path(name), 'rb'))",
+        'flat (mmap)': "store.get(name)",
+    }
+    for label, load in loads.items():
+        code = probe.format(root=str(data_dir.parent), data=str(data_dir), load=load)
+        seconds, rss = subprocess.check_output([sys.executable, '-c', code], text=True).split()
+        print(f"  {label:>12}: {float(seconds) * 1000:.1f}ms, +{rss} MiB RSS")
+
+    print("\n✅ Model store tests complete!")
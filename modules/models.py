@@ -9,8 +9,13 @@ from pathlib import Path
 from typing import Dict, Tuple, Optional, List
 import pickle
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 
+from modules.model_store import FlatForest, ModelStore
+from modules.model_registry import FeatureImputer, FeatureSchema, ModelRegistry, get_model_registry, imputer_path
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -18,16 +23,34 @@ logger = logging.getLogger(__name__)
 class ModelPredictor:
     """Handles model loading and predictions"""
     
-    def __init__(self, models_dir: Path):
+    # Largest batch scored by the ForestEvaluator; bigger batches run through
+    # scikit-learn, whose per-tree loops have about twice its throughput there
+    FLAT_MAX_ROWS = 1024
+    
+    def __init__(
+        self,
+        models_dir: Path,
+        interval_quantiles: Tuple[float, float] = (0.025, 0.975),
+        registry: Optional[ModelRegistry] = None
+    ):
         """
         Initialize model predictor
         
         Args:
-            models_dir: Directory containing saved model files
+            models_dir: Directory containing saved model files and model_manifest.json
+            interval_quantiles: Lower/upper tree quantiles used for forecast ranges
+            registry: Feature-schema registry to bind models in (defaults to the
+                process-wide registry of models_dir, shared with FeatureEngineer)
         """
         self.models_dir = Path(models_dir)
+        self.registry = registry or get_model_registry(self.models_dir)
+        self.store = self.registry.store or ModelStore(self.models_dir)
         self.models = {}
+        self.model_paths = {}
         self.scalers = {}
+        self.interval_quantiles = interval_quantiles
+        self.interval_engines = {}
+        self.evaluators = {}
         
     def load_model(self, model_name: str, model_path: Optional[Path] = None) -> bool:
         """
@@ -35,23 +58,37 @@ class ModelPredictor:
         
         Args:
             model_name: Name to store model under ('nprs1', 'rf11', etc.)
-            model_path: Path to model file. If None, uses default naming
+            model_path: Path to a pickled model. If None, the flat artifact
+                registered in the model manifest is memory-mapped
             
         Returns:
             True if successful, False otherwise
         """
         try:
             if model_path is None:
-                model_path = self.models_dir / f"{model_name}.pkl"
+                model_path = self.store.source_path(model_name)
+                self.models[model_name] = self.store.get(model_name)
+            else:
+                with open(model_path, 'rb') as f:
+                    self.models[model_name] = pickle.load(f)
+            self.interval_engines.pop(model_name, None)
+            self.evaluators.pop(model_name, None)
+            self.model_paths[model_name] = Path(model_path)
+            self.registry.bind(model_name, self.models[model_name])
             
-            with open(model_path, 'rb') as f:
-                self.models[model_name] = pickle.load(f)
+            # Training-window medians stored next to the artifact
+            imputer_file = imputer_path(model_path)
+            if imputer_file.exists():
+                self.registry.attach_imputer(model_name, FeatureImputer.load(imputer_file))
+            else:
+                logger.warning(f"No imputer for {model_name} at {imputer_file}: NaN inputs will not be "
+                               f"imputed (create it offline with fit_model_imputers)")
             
             logger.info(f"Loaded model: {model_name} from {model_path}")
             return True
             
-        except FileNotFoundError:
-            logger.warning(f"Model file not found: {model_path}")
+        except FileNotFoundError as e:
+            logger.warning(f"Model file not found: {model_path or e}")
             # Create dummy model for demonstration
             self._create_dummy_model(model_name)
             return False
@@ -61,8 +98,97 @@ class ModelPredictor:
             self._create_dummy_model(model_name)
             return False
     
+    def get_model(self, model_name: str):
+        """
+        Get a model, loading it on first use
+        
+        Manifest models are reloaded when their manifest entry or pickle
+        changes, so a swapped model is picked up without a restart.
+        """
+        if model_name not in self.models or self.store.is_stale(model_name):
+            self.load_model(model_name)
+        return self.models[model_name]
+    
+    def get_scorer(self, model_name: str, n_rows: int = 1):
+        """
+        Get the object predictions are computed with
+        
+        Random Forests are scored by a cached ForestEvaluator over their flat
+        node arrays for single rows and small batches (identical output, no
+        per-call sklearn overhead). Batches above FLAT_MAX_ROWS go to the
+        scikit-learn estimator (unpickled from the manifest source for flat
+        artifacts). Any other model is returned as is.
+        
+        Args:
+            model_name: Model to score with
+            n_rows: Number of rows about to be scored
+        """
+        model = self.get_model(model_name)
+        if not isinstance(model, (RandomForestRegressor, RandomForestClassifier, FlatForest)):
+            return model
+        if n_rows > self.FLAT_MAX_ROWS:
+            if not isinstance(model, FlatForest):
+                return model
+            try:
+                return self.store.estimator(model_name)
+            except FileNotFoundError:
+                pass
+        
+        evaluator = self.evaluators.get(model_name)
+        if evaluator is None or evaluator.model is not model:
+            evaluator = ForestEvaluator(model)
+            self.evaluators[model_name] = evaluator
+        return evaluator
+    
+    def get_schema(self, model_name: str) -> FeatureSchema:
+        """Feature schema of a model (loading the model first if needed)"""
+        self.get_model(model_name)
+        return self.registry.schema(model_name)
+    
+    def fit_imputer(
+        self,
+        model_name: str,
+        features: pd.DataFrame,
+        train_cutoff,
+        save: bool = True
+    ) -> FeatureImputer:
+        """
+        Compute a model's imputation medians over the training window
+        
+        Args:
+            model_name: Model to fit the imputer for
+            features: Engineered feature frame (with Date)
+            train_cutoff: End of the training window (FeatureEngineer.train_cutoff)
+            save: Store the medians next to the model artifact
+            
+        Returns:
+            Fitted FeatureImputer, also applied to the model's schema
+        """
+        schema = self.get_schema(model_name)
+        imputer = FeatureImputer.fit(features, schema.features, train_cutoff)
+        self.registry.attach_imputer(model_name, imputer)
+        
+        model_path = self.model_paths.get(model_name)
+        if save and model_path is not None:
+            imputer.save(imputer_path(model_path))
+            logger.info(f"Saved {model_name} imputer ({imputer.n_rows} training rows) to {imputer_path(model_path)}")
+        return imputer
+    
+    def _model_inputs(self, features: pd.DataFrame, schema: FeatureSchema, last_row: bool) -> np.ndarray:
+        """Model input matrix from the shared feature matrix, NaNs filled with training medians"""
+        X = schema.take(self.registry.matrix(features, last_row=last_row))
+        if np.isnan(X).any():
+            if schema.has_impute_values:
+                X = schema.impute(X)
+            else:
+                logger.warning(f"NaN values in {schema.model_name} features and no training medians to fill them")
+        return X
+    
     def _create_dummy_model(self, model_name: str):
         """Create a dummy model when real model not available"""
+        self.interval_engines.pop(model_name, None)
+        self.evaluators.pop(model_name, None)
+        self.model_paths.pop(model_name, None)
         if model_name == 'nprs1':
             # Binary classifier
             self.models[model_name] = RandomForestClassifier(
@@ -77,6 +203,9 @@ class ModelPredictor:
                 max_depth=7,
                 random_state=42
             )
+        else:
+            return
+        self.registry.bind(model_name, self.models[model_name])
         logger.info(f"Created dummy {model_name} model")
     
     def predict_direction(
@@ -94,16 +223,11 @@ class ModelPredictor:
         Returns:
             Dict with prediction, probability, and confidence
         """
-        if model_name not in self.models:
-            self.load_model(model_name)
-        
-        model = self.models[model_name]
-        
-        # Required features for NPRS-1
-        required_features = ['L_Vol', 'L_Regime', 'L_Inten', 'L_GPR', 'L_Accel']
+        model = self.get_model(model_name)
+        schema = self.registry.schema(model_name)
         
         # Validate features
-        missing = [f for f in required_features if f not in features.columns]
+        missing = schema.missing(self.registry.matrix(features, last_row=True))
         if missing:
             logger.error(f"Missing features for direction prediction: {missing}")
             return {
@@ -112,23 +236,19 @@ class ModelPredictor:
                 'confidence': 0.0,
             }
         
-        # Get latest row
-        X = features[required_features].iloc[[-1]]
-        
-        # Handle NaN
-        if X.isna().any().any():
-            logger.warning("NaN values in features, filling with median")
-            X = X.fillna(X.median())
+        # Latest row, from the matrix shared with the other models
+        X = self._model_inputs(features, schema, last_row=True)
         
         try:
             # Predict
+            scorer = self.get_scorer(model_name)
             if hasattr(model, 'predict_proba'):
-                proba = model.predict_proba(X)[0]
+                proba = scorer.predict_proba(X)[0]
                 pred = 1 if proba[1] > 0.5 else 0
                 confidence = max(proba)
             else:
                 # Fallback for models without predict_proba
-                pred = model.predict(X)[0]
+                pred = scorer.predict(X)[0]
                 confidence = 0.68  # Use historical accuracy
                 proba = [1-confidence, confidence] if pred == 1 else [confidence, 1-confidence]
             
@@ -161,20 +281,11 @@ class ModelPredictor:
         Returns:
             Dict with prediction, range, and confidence
         """
-        if model_name not in self.models:
-            self.load_model(model_name)
-        
-        model = self.models[model_name]
-        
-        # Required features for RF11
-        required_features = [
-            'L_Vol', 'L_Regime', 'L_Inten', 'L_WTI_Ret', 'L_GPR',
-            'L_Accel', 'L_News_Shk', 'L_MS_Vol_Safe',
-            'L_State_S_Safe', 'L_Crowd_Safe', 'L_Vol_Std'
-        ]
+        self.get_model(model_name)
+        schema = self.registry.schema(model_name)
         
         # Validate features
-        missing = [f for f in required_features if f not in features.columns]
+        missing = schema.missing(self.registry.matrix(features, last_row=True))
         if missing:
             logger.error(f"Missing features for level prediction: {missing}")
             # Return last known volatility as fallback
@@ -185,23 +296,17 @@ class ModelPredictor:
                 'confidence_level': 'LOW',
             }
         
-        # Get latest row
-        X = features[required_features].iloc[[-1]]
-        
-        # Handle NaN
-        if X.isna().any().any():
-            logger.warning("NaN values in features, filling with median")
-            X = X.fillna(X.median())
+        # Latest row, from the matrix shared with the other models
+        X = self._model_inputs(features, schema, last_row=True)
         
         try:
-            # Predict
-            prediction = model.predict(X)[0]
-            
-            # Estimate confidence interval (±3 std errors based on historical performance)
-            # Typical RMSE for this model is ~0.03
-            std_error = 0.03
-            range_low = max(0, prediction - 1.96 * std_error)
-            range_high = prediction + 1.96 * std_error
+            # Predict, with the interval taken from the spread of the individual trees
+            prediction = self.get_scorer(model_name).predict(X)[0]
+            lower, upper = self.get_interval_engine(model_name).quantiles(
+                X, self.interval_quantiles
+            )
+            range_low = max(0, lower[0])
+            range_high = upper[0]
             
             # Determine confidence level based on regime state
             regime_prob = float(features['L_Regime'].iloc[-1])
@@ -241,30 +346,20 @@ class ModelPredictor:
         Returns:
             Dict mapping feature names to importance scores
         """
-        if model_name not in self.models:
-            self.load_model(model_name)
-        
-        model = self.models[model_name]
+        model = self.get_model(model_name)
         
         if not hasattr(model, 'feature_importances_'):
             logger.warning(f"Model {model_name} does not have feature_importances_")
             return {}
         
         # Get feature names
-        if model_name == 'nprs1':
-            features = ['L_Vol', 'L_Regime', 'L_Inten', 'L_GPR', 'L_Accel']
-        elif model_name == 'rf11':
-            features = [
-                'L_Vol', 'L_Regime', 'L_Inten', 'L_WTI_Ret', 'L_GPR',
-                'L_Accel', 'L_News_Shk', 'L_MS_Vol_Safe',
-                'L_State_S_Safe', 'L_Crowd_Safe', 'L_Vol_Std'
-            ]
-        else:
-            logger.error(f"Unknown model: {model_name}")
-            return {}
+        features = self.registry.schema(model_name).features
         
         # Get importances
         importances = model.feature_importances_
+        if len(importances) != len(features):
+            logger.error(f"Model {model_name} has {len(importances)} importances for {len(features)} features")
+            return {}
         
         # Create dict
         importance_dict = dict(zip(features, importances))
@@ -278,12 +373,31 @@ class ModelPredictor:
         
         return importance_dict
     
+    def get_interval_engine(self, model_name: str) -> 'TreeIntervalEngine':
+        """
+        Get (or build) the cached per-tree interval engine for a model
+        
+        Args:
+            model_name: Name of a fitted Random Forest model
+            
+        Returns:
+            TreeIntervalEngine bound to the current model object
+        """
+        model = self.get_model(model_name)
+        
+        engine = self.interval_engines.get(model_name)
+        if engine is None or engine.model is not model:
+            engine = TreeIntervalEngine(model)
+            self.interval_engines[model_name] = engine
+        return engine
+    
     def calculate_prediction_intervals(
         self,
         features: pd.DataFrame,
         model_name: str = 'rf11',
-        n_estimators: Optional[int] = None
-    ) -> Tuple[np.ndarray, np.ndarray]:
+        n_estimators: Optional[int] = None,
+        quantiles: Tuple[float, ...] = (0.025, 0.975)
+    ) -> Tuple[np.ndarray, ...]:
         """
         Calculate prediction intervals using tree variance
         
@@ -291,29 +405,21 @@ class ModelPredictor:
             features: Input features
             model_name: Model to use
             n_estimators: Number of trees to use (None = all)
+            quantiles: Quantile levels to compute, in [0, 1]
             
         Returns:
-            Tuple of (lower_bound, upper_bound) arrays
+            Tuple with one array per quantile level (lower_bound, upper_bound by default)
         """
-        if model_name not in self.models:
-            self.load_model(model_name)
-        
-        model = self.models[model_name]
+        model = self.get_model(model_name)
         
-        if not isinstance(model, (RandomForestRegressor, RandomForestClassifier)):
+        if not isinstance(model, (RandomForestRegressor, RandomForestClassifier, FlatForest)):
             logger.error("Prediction intervals only work for Random Forest models")
-            return np.array([]), np.array([])
-        
-        # Get predictions from all trees
-        predictions = np.array([
-            tree.predict(features) for tree in model.estimators_
-        ])
-        
-        # Calculate percentiles
-        lower = np.percentile(predictions, 2.5, axis=0)
-        upper = np.percentile(predictions, 97.5, axis=0)
+            return tuple(np.array([]) for _ in quantiles)
         
-        return lower, upper
+        result = self.get_interval_engine(model_name).quantiles(
+            features, quantiles, n_estimators=n_estimators
+        )
+        return tuple(result)
     
     def batch_predict(
         self,
@@ -322,7 +428,10 @@ class ModelPredictor:
         prediction_type: str = 'level'
     ) -> pd.DataFrame:
         """
-        Make predictions for multiple rows
+        Make predictions for multiple rows in a single model call
+        
+        Columns are validated and NaNs imputed once for the whole frame,
+        then the model is called once over every row.
         
         Args:
             features: DataFrame with multiple rows
@@ -330,75 +439,355 @@ class ModelPredictor:
             prediction_type: 'level' or 'direction'
             
         Returns:
-            DataFrame with predictions
+            DataFrame with predictions (one row per input row)
         """
-        results = []
+        model = self.get_model(model_name)
+        schema = self.registry.schema(model_name)
+        n_rows = len(features)
         
-        for idx in range(len(features)):
-            row_features = features.iloc[[idx]]
-            
+        # Validate features once for the whole batch
+        missing = schema.missing(self.registry.matrix(features))
+        if missing:
+            logger.error(f"Missing features for batch {prediction_type} prediction: {missing}")
+            fallback = self._batch_fallback(
+                n_rows, prediction_type, 'UNKNOWN' if prediction_type == 'direction' else 'LOW'
+            )
+            if prediction_type != 'direction' and 'Volatility' in features.columns:
+                fallback['forecast'] = features['Volatility'].to_numpy(dtype=float)
+            return fallback
+        
+        # Handle NaN once, using the training medians
+        X = self._model_inputs(features, schema, last_row=False)
+        
+        try:
+            scorer = self.get_scorer(model_name, n_rows)
             if prediction_type == 'direction':
-                pred = self.predict_direction(
-                    pd.concat([features.iloc[:idx+1], row_features]),
-                    model_name
-                )
-            else:
-                pred = self.predict_level(
-                    pd.concat([features.iloc[:idx+1], row_features]),
-                    model_name
-                )
+                if hasattr(model, 'predict_proba'):
+                    proba = scorer.predict_proba(X)
+                    prob_up = proba[:, 1]
+                    pred = prob_up > 0.5
+                    confidence = proba.max(axis=1)
+                else:
+                    # Fallback for models without predict_proba
+                    pred = scorer.predict(X) == 1
+                    confidence = np.full(n_rows, 0.68)  # Use historical accuracy
+                    prob_up = np.where(pred, confidence, 1 - confidence)
+                
+                return pd.DataFrame({
+                    'direction': np.where(pred, 'UP', 'DOWN'),
+                    'probability': prob_up.astype(float),
+                    'confidence': confidence.astype(float),
+                })
             
-            results.append(pred)
+            prediction = scorer.predict(X)
+            lower, upper = self.get_interval_engine(model_name).quantiles(
+                X, self.interval_quantiles
+            )
+            return pd.DataFrame({
+                'forecast': prediction.astype(float),
+                'range_low': np.maximum(0, lower),
+                'range_high': upper,
+                'confidence_level': _regime_confidence(features['L_Regime'].to_numpy(dtype=float)),
+            })
+            
+        except Exception as e:
+            logger.error(f"Error in batch {prediction_type} prediction: {e}")
+            return self._batch_fallback(n_rows, prediction_type, 'ERROR')
+    
+    @staticmethod
+    def _batch_fallback(n_rows: int, prediction_type: str, label: str) -> pd.DataFrame:
+        """Build the per-row fallback frame used when a batch cannot be scored"""
+        if prediction_type == 'direction':
+            return pd.DataFrame({
+                'direction': [label] * n_rows,
+                'probability': np.full(n_rows, 0.5),
+                'confidence': np.zeros(n_rows),
+            })
+        return pd.DataFrame({
+            'forecast': np.full(n_rows, 0.20),
+            'range_low': np.full(n_rows, 0.15),
+            'range_high': np.full(n_rows, 0.25),
+            'confidence_level': [label] * n_rows,
+        })
+
+
+class TreeIntervalEngine:
+    """
+    Per-tree quantiles for Random Forests without per-estimator predict() calls
+    
+    Leaf values of every tree are flattened into one lookup table at build time.
+    Scoring converts the input to float32 once, reads each tree's leaf indices
+    with the low-level tree_.apply (optionally across threads, it releases the
+    GIL) into a preallocated buffer and gathers the leaf values from the table.
+    Rows are processed in chunks, so at most n_trees x chunk_size values are
+    held in memory at any time. For classifiers the per-tree output is the
+    probability of the positive class. Flat (memory-mapped) forests are walked
+    by a ForestEvaluator, all trees at once.
+    """
+    
+    def __init__(self, model, chunk_size: int = 4096, n_jobs: Optional[int] = None):
+        """
+        Args:
+            model: Fitted RandomForestRegressor, RandomForestClassifier or FlatForest
+            chunk_size: Rows scored per pass over the trees
+            n_jobs: Threads used to walk the trees (None/1 = current thread)
+        """
+        self.model = model
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+        
+        self.evaluator = None
+        if isinstance(model, FlatForest):
+            # Node ids are already global and node_output holds the per-node prediction
+            self.evaluator = ForestEvaluator(model)
+            self.n_trees = model.n_trees
+            self.offsets = np.zeros(self.n_trees, dtype=np.intp)
+            self.leaf_values = model.node_output
+            return
+        
+        self.trees = [estimator.tree_ for estimator in model.estimators_]
+        self.n_trees = len(self.trees)
+        self.apply_tree = lambda t, X: self.trees[t].apply(X)
+        
+        leaf_values = []
+        for tree in self.trees:
+            value = tree.value[:, 0, :]
+            if isinstance(model, RandomForestClassifier):
+                value = value / value.sum(axis=1, keepdims=True)
+                leaf_values.append(value[:, -1])
+            else:
+                leaf_values.append(value[:, 0])
+        
+        node_counts = np.array([tree.node_count for tree in self.trees])
+        self.offsets = np.concatenate([[0], np.cumsum(node_counts)[:-1]]).astype(np.intp)
+        self.leaf_values = np.concatenate(leaf_values)
+    
+    def _apply_trees(self, X: np.ndarray, leaves: np.ndarray, tree_ids: range):
+        """Write global leaf indices of the given trees into rows of the buffer"""
+        for t in tree_ids:
+            np.add(self.apply_tree(t, X), self.offsets[t], out=leaves[t])
+    
+    def quantiles(
+        self,
+        features,
+        quantiles: Tuple[float, ...] = (0.025, 0.975),
+        n_estimators: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Compute per-row quantiles of the individual tree predictions
         
-        return pd.DataFrame(results)
+        Args:
+            features: Input features (DataFrame or array) in the model's column order
+            quantiles: Quantile levels to compute, in [0, 1]
+            n_estimators: Number of trees to use (None = all)
+            
+        Returns:
+            Array of shape (n_quantiles, n_rows)
+        """
+        n_trees = self.n_trees if n_estimators is None else min(n_estimators, self.n_trees)
+        X = np.ascontiguousarray(features, dtype=np.float32)
+        n_rows = X.shape[0]
+        
+        result = np.empty((len(quantiles), n_rows))
+        chunk_rows = min(self.chunk_size, n_rows)
+        leaves = np.empty((n_trees, chunk_rows), dtype=np.intp)
+        tree_preds = np.empty((n_trees, chunk_rows))
+        
+        n_jobs = min(self.n_jobs or 1, n_trees)
+        groups = [range(i, n_trees, n_jobs) for i in range(n_jobs)]
+        
+        with ThreadPoolExecutor(max_workers=n_jobs) if n_jobs > 1 else nullcontext() as pool:
+            for start in range(0, n_rows, self.chunk_size):
+                stop = min(start + self.chunk_size, n_rows)
+                chunk = X[start:stop]
+                chunk_leaves = leaves[:, :stop - start]
+                
+                if self.evaluator is not None:
+                    chunk_leaves[:] = self.evaluator.leaves(chunk, n_trees)
+                elif pool is None:
+                    self._apply_trees(chunk, chunk_leaves, groups[0])
+                else:
+                    list(pool.map(lambda ids: self._apply_trees(chunk, chunk_leaves, ids), groups))
+                
+                chunk_preds = tree_preds[:, :stop - start]
+                np.take(self.leaf_values, chunk_leaves, out=chunk_preds)
+                result[:, start:stop] = np.quantile(chunk_preds, quantiles, axis=0)
+        
+        return result
+
+
+class ForestEvaluator:
+    """
+    Compiled Random Forest scoring over flat node arrays
+    
+    All trees are walked at once: a (n_trees, n_rows) array of node ids is
+    advanced one level per step with gathers from the feature, threshold and
+    child arrays, for as many steps as the deepest tree (leaves point to
+    themselves, so finished trees stay put). Output is identical to
+    scikit-learn's: inputs are cast to float32 before the threshold tests,
+    NaNs take each split's missing-value direction, per-tree outputs are accumulated in tree order (cumulative sum) and
+    divided by the number of trees.
+    """
+    
+    # Node ids walked per pass; keeps the gathers cache-resident
+    BLOCK_NODES = 65536
+    
+    def __init__(self, model):
+        """
+        Args:
+            model: FlatForest, or a fitted scikit-learn Random Forest to flatten
+        """
+        self.model = model
+        self.forest = model if isinstance(model, FlatForest) else FlatForest.from_sklearn(model)
+        
+        forest = self.forest
+        self.roots = np.asarray(forest.tree_offsets[:-1], dtype=np.intp)
+        self.depth = int(np.max(forest.tree_depths))
+        self.chunk_size = max(1, self.BLOCK_NODES // forest.n_trees)
+        self.feature = np.asarray(forest.feature, dtype=np.intp)
+        self.value = np.asarray(forest.value)
+        
+        # For float32 x, x <= t exactly when x <= (largest float32 <= t), so the
+        # tests can run in float32 without promoting every gathered input
+        threshold = np.asarray(forest.threshold, dtype=np.float64)
+        threshold32 = threshold.astype(np.float32)
+        rounded_up = threshold32.astype(np.float64) > threshold
+        threshold32[rounded_up] = np.nextafter(threshold32[rounded_up], np.float32(-np.inf))
+        self.threshold = threshold32
+        
+        # children[2 * node + (x <= t)]: right child first, then the left one
+        self.children = np.column_stack([forest.right, forest.left]).astype(np.intp).ravel()
+        self.missing_left = np.asarray(forest.missing_left, dtype=bool)
+    
+    def leaves(self, X: np.ndarray, n_trees: Optional[int] = None) -> np.ndarray:
+        """Global leaf ids, shape (n_trees, n_rows), for a float32 matrix"""
+        roots = self.roots if n_trees is None else self.roots[:n_trees]
+        n_rows, n_features = X.shape
+        flat_X = np.ascontiguousarray(X).ravel()
+        row_base = np.arange(n_rows, dtype=np.intp) * n_features
+        
+        # NaN inputs follow each split's missing-value direction, as in scikit-learn
+        has_nan = np.isnan(flat_X).any()
+        
+        node = np.repeat(roots[:, np.newaxis], n_rows, axis=1)
+        for _ in range(self.depth):
+            x = flat_X[row_base + self.feature[node]]
+            go_left = x <= self.threshold[node]
+            if has_nan:
+                go_left |= np.isnan(x) & self.missing_left[node]
+            node = self.children[2 * node + go_left]
+        return node
+    
+    def _mean_value(self, X) -> np.ndarray:
+        X = self.forest._validate(X)
+        n_rows = X.shape[0]
+        result = np.empty((n_rows, self.value.shape[1]))
+        for start in range(0, n_rows, self.chunk_size):
+            stop = min(start + self.chunk_size, n_rows)
+            tree_values = self.value[self.leaves(X[start:stop])]
+            # cumsum adds the trees one after another, the order scikit-learn uses
+            result[start:stop] = np.cumsum(tree_values, axis=0)[-1] / self.forest.n_trees
+        return result
+    
+    def predict_proba(self, X) -> np.ndarray:
+        """Class probabilities (classifiers only), as RandomForestClassifier.predict_proba"""
+        if not self.forest.is_classifier:
+            raise AttributeError("predict_proba is only available for classifiers")
+        return self._mean_value(X)
+    
+    def predict(self, X) -> np.ndarray:
+        """Predicted class or value, as the scikit-learn forest's predict"""
+        mean = self._mean_value(X)
+        if self.forest.is_classifier:
+            return self.forest.classes_.take(np.argmax(mean, axis=1))
+        return mean[:, 0]
+
+
+def _regime_confidence(regime_prob: np.ndarray) -> np.ndarray:
+    """
+    Vectorized confidence labels from the lagged regime probability
+    
+    Mirrors the single-row rule in predict_level: clear regimes are HIGH,
+    the 0.4-0.6 transition band is LOW, everything else MODERATE.
+    """
+    return np.select(
+        [(regime_prob < 0.3) | (regime_prob > 0.7),
+         (regime_prob >= 0.4) & (regime_prob <= 0.6)],
+        ['HIGH', 'LOW'],
+        default='MODERATE'
+    )
 
 
 def load_models_from_dir(models_dir: Path) -> ModelPredictor:
     """
-    Factory function to create ModelPredictor and load all models
+    Factory function to create a ModelPredictor for a models directory
+    
+    Models listed in the directory's model_manifest.json are loaded lazily,
+    on their first prediction, from memory-mapped flat artifacts.
     
     Args:
-        models_dir: Directory with model files
+        models_dir: Directory with model files and model_manifest.json
         
     Returns:
-        ModelPredictor instance with models loaded
+        ModelPredictor instance
+    """
+    return ModelPredictor(models_dir)
+
+
+def fit_model_imputers(
+    models_dir: Optional[Path] = None,
+    train_cutoff: str = '2021-01-01',
+    model_names: Tuple[str, ...] = ('nprs1', 'rf11')
+) -> Dict[str, FeatureImputer]:
     """
-    predictor = ModelPredictor(models_dir)
+    Offline step: fit and store the imputers of the manifest models
     
-    # Try to load all known models
-    predictor.load_model('nprs1')
-    predictor.load_model('rf11')
+    Medians come from the WTI history the models were trained on, never from
+    data being scored; scoring only reads the stored files. Run after training
+    or swapping a model (python -m modules.models fit-imputers).
+    
+    Args:
+        models_dir: Directory with the models and model_manifest.json (defaults to data/)
+        train_cutoff: End of the training window (FeatureEngineer.train_cutoff)
+        model_names: Models to fit imputers for
+        
+    Returns:
+        Model name -> saved FeatureImputer
+    """
+    from modules.data_loader import DataLoader
+    from modules.feature_engineering import FeatureEngineer
+    from modules.model_registry import DEFAULT_MODELS_DIR
     
-    return predictor
+    engineer = FeatureEngineer(train_cutoff=train_cutoff)
+    features = engineer.create_all_features(DataLoader().merge_all_data())
+    predictor = ModelPredictor(Path(models_dir or DEFAULT_MODELS_DIR))
+    return {name: predictor.fit_imputer(name, features, engineer.train_cutoff) for name in model_names}
 
 
 if __name__ == '__main__':
-    # Test model predictor
+    import sys
+    if sys.argv[1:] == ['fit-imputers']:
+        for name, imputer in fit_model_imputers().items():
+            print(f"{name}: {len(imputer.medians)} medians over {imputer.n_rows} training rows")
+        sys.exit(0)
+    
+    # Test model predictor on the shipped models and the real feature history
     print("Testing ModelPredictor...")
+    from modules.data_loader import DataLoader
+    from modules.feature_engineering import FeatureEngineer
+    from modules.model_registry import DEFAULT_MODELS_DIR
     
-    # Create sample features
-    sample_features = pd.DataFrame({
-        'L_Vol': [0.187],
-        'L_Regime': [0.55],
-        'L_Inten': [245],
-        'L_WTI_Ret': [0.042],
-        'L_GPR': [168],
-        'L_Accel': [0.015],
-        'L_News_Shk': [-0.02],
-        'L_MS_Vol_Safe': [0.15],
-        'L_State_S_Safe': [-0.01],
-        'L_Crowd_Safe': [0.03],
-        'L_Vol_Std': [0.08],
-        'Volatility': [0.187],  # Current volatility for fallback
-    })
-    
-    # Create predictor (will use dummy models since files don't exist yet)
-    models_dir = Path(__file__).parent.parent / 'data' / 'models'
-    predictor = ModelPredictor(models_dir)
+    sample_features = FeatureEngineer().create_all_features(DataLoader().merge_all_data())
+    
+    # Models come from data/model_manifest.json; a dummy fallback would fail here
+    predictor = ModelPredictor(DEFAULT_MODELS_DIR)
+    for name in ('nprs1', 'rf11'):
+        assert predictor.load_model(name), f"Could not load {name} from {DEFAULT_MODELS_DIR}"
     
     # Test direction prediction
     print("\nTesting direction prediction:")
     direction_result = predictor.predict_direction(sample_features)
+    assert direction_result['direction'] in ('UP', 'DOWN'), direction_result
     print(f"  Direction: {direction_result['direction']}")
     print(f"  Probability: {direction_result['probability']:.2%}")
     print(f"  Confidence: {direction_result['confidence']:.2%}")
@@ -406,6 +795,7 @@ if __name__ == '__main__':
     # Test level prediction
     print("\nTesting level prediction:")
     level_result = predictor.predict_level(sample_features)
+    assert level_result['confidence_level'] != 'ERROR', level_result
     print(f"  Forecast: {level_result['forecast']:.3f}")
     print(f"  Range: {level_result['range_low']:.3f} - {level_result['range_high']:.3f}")
     print(f"  Confidence: {level_result['confidence_level']}")
@@ -416,4 +806,59 @@ if __name__ == '__main__':
     for feat, imp in list(importance.items())[:5]:
         print(f"  {feat}: {imp:.3f}")
     
+    # Compiled evaluator vs scikit-learn on the shipped models
+    import time
+    print("\nBenchmarking ForestEvaluator against scikit-learn:")
+    rng = np.random.default_rng(42)
+    for name in ('nprs1', 'rf11'):
+        sk_model = predictor.store.estimator(name)
+        evaluator = predictor.get_scorer(name)
+        bench = pd.DataFrame(rng.normal(size=(100_000, sk_model.n_features_in_)),
+                             columns=predictor.registry.feature_names(name))
+        
+        score = 'predict_proba' if isinstance(sk_model, RandomForestClassifier) else 'predict'
+        assert np.array_equal(getattr(sk_model, score)(bench), getattr(evaluator, score)(bench))
+        
+        timings = {}
+        for label, scorer in (('sklearn', getattr(sk_model, score)), ('flat', getattr(evaluator, score))):
+            row = bench.iloc[:1]
+            single = []
+            for _ in range(100):
+                start = time.perf_counter()
+                scorer(row)
+                single.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            scorer(bench)
+            timings[label] = (np.median(single) * 1000, len(bench) / (time.perf_counter() - start))
+        
+        print(f"  {name} (identical output):")
+        for label, (latency, throughput) in timings.items():
+            print(f"    {label:>7}: single row {latency:.3f}ms | batch {throughput:,.0f} rows/s")
+        dispatch = {n: type(predictor.get_scorer(name, n)).__name__ for n in (1, predictor.FLAT_MAX_ROWS + 1)}
+        print(f"    get_scorer by batch size: {dispatch}")
+    
+    # Benchmark batch_predict against the legacy row-by-row loop, on rows resampled
+    # from the real feature history
+    print("\nBenchmarking batch_predict (RF11):")
+    rf11_features = predictor.registry.feature_names('rf11')
+    history = sample_features[rf11_features].dropna()
+    
+    for n_rows in (300, 10_000, 100_000):
+        bench = history.sample(n_rows, replace=True, random_state=42).reset_index(drop=True)
+        
+        start = time.perf_counter()
+        predictor.batch_predict(bench, 'rf11', 'level')
+        batch_time = time.perf_counter() - start
+        
+        # The old loop is quadratic; only time it where it finishes in reasonable time
+        if n_rows <= 10_000:
+            start = time.perf_counter()
+            for idx in range(n_rows):
+                predictor.predict_level(pd.concat([bench.iloc[:idx+1], bench.iloc[[idx]]]), 'rf11')
+            loop_time = f"{time.perf_counter() - start:.2f}s"
+        else:
+            loop_time = "skipped"
+        
+        print(f"  {n_rows:>9,} rows: batch {batch_time:.2f}s | loop {loop_time}")
+    
     print("\n✅ Model predictor tests complete!")
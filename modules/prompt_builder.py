@@ -0,0 +1,204 @@
+"""
+OVIP - Prompt Builder Module
+Assembles the AI daemon prompt under a token budget: the live snapshot and the
+command are always kept, the top-k historical months retrieved from the RAG
+index fill their share, and chat memory keeps the latest turns verbatim while
+older turns are condensed to their opening sentence. Prompt sizes are logged
+per section so cost and latency per query can be tracked.
+"""
+
+import re
+import math
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from modules.settings import get_secret
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and single punctuation marks; long pieces count as several tokens
+_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s|\n")
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text: str) -> int:
+    """Approximate BPE token count (no tokenizer dependency)"""
+    return sum(math.ceil(len(piece) / CHARS_PER_TOKEN) for piece in _PIECE_PATTERN.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text after roughly max_tokens tokens, marking the cut with an ellipsis"""
+    used = 0
+    for match in _PIECE_PATTERN.finditer(text):
+        used += math.ceil(len(match.group()) / CHARS_PER_TOKEN)
+        if used > max_tokens:
+            return text[:match.start()].rstrip() + "…"
+    return text
+
+
+def summarize_turn(content: str, max_tokens: int) -> str:
+    """Condense an older chat turn to its first sentence (or line), within max_tokens"""
+    text = content.strip()
+    first = _SENTENCE_END.split(text, maxsplit=1)[0].strip() if text else ""
+    return truncate_tokens(first, max_tokens)
+
+
+@dataclass
+class PromptBudget:
+    """Token limits for the assembled prompt"""
+    total: int = 2000
+    retrieval: int = 400
+    history: int = 500
+    top_k: int = 5
+    recent_turns: int = 2
+    recent_turn_tokens: int = 200
+    summary_tokens: int = 30
+    max_turns: int = 12
+
+    @classmethod
+    def from_settings(cls) -> 'PromptBudget':
+        """Default budget, with the total overridable through OVIP_PROMPT_TOKENS"""
+        return cls(total=int(get_secret('OVIP_PROMPT_TOKENS', cls.total)))
+
+
+@dataclass
+class BuiltPrompt:
+    messages: List[Dict[str, str]]
+    tokens: Dict[str, int] = field(default_factory=dict)
+    retrieved: int = 0
+    turns: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+
+def _history_lines(history: Sequence[Dict], budget: PromptBudget, limit: int) -> List[str]:
+    """Chat memory lines, newest first until the token limit; the latest turns stay verbatim"""
+    lines = []
+    used = 0
+    for age, msg in enumerate(reversed(history[-budget.max_turns:])):
+        role = "USER" if msg['role'] == 'user' else "OVIP_DAEMON"
+        if age < budget.recent_turns:
+            content = truncate_tokens(msg['content'], budget.recent_turn_tokens)
+        else:
+            content = summarize_turn(msg['content'], budget.summary_tokens)
+        line = f"{role}: {content}"
+        cost = count_tokens(line)
+        if used + cost > limit:
+            break
+        lines.append(line)
+        used += cost
+    return lines[::-1]
+
+
+def prior_turns(user_query: str, history: Optional[Sequence[Dict]], budget: Optional[PromptBudget] = None) -> List[Dict]:
+    """The chat turns build_prompt can draw on: at most max_turns, without a trailing copy of the command"""
+    budget = budget or PromptBudget.from_settings()
+    history = list(history or [])
+    if history and history[-1]['role'] == 'user' and history[-1]['content'] == user_query:
+        history = history[:-1]
+    return history[-budget.max_turns:]
+
+
+def build_prompt(
+    system_prompt: str,
+    live_context: str,
+    user_query: str,
+    history: Optional[Sequence[Dict]] = None,
+    index=None,
+    budget: Optional[PromptBudget] = None
+) -> BuiltPrompt:
+    """
+    Build the daemon chat messages within a token budget
+
+    Args:
+        system_prompt: System message
+        live_context: The LIVE_DATA line
+        user_query: Current command
+        history: Chat log as {'role', 'content'} dicts; a trailing copy of the
+            current command is ignored
+        index: RetrievalIndex to pull the top-k historical months from
+        budget: Token limits (defaults to PromptBudget.from_settings())
+
+    Returns:
+        BuiltPrompt with the messages and per-section token counts
+    """
+    budget = budget or PromptBudget.from_settings()
+    history = prior_turns(user_query, history, budget)
+
+    tokens = {
+        'system': count_tokens(system_prompt),
+        'live_data': count_tokens(live_context),
+        'command': count_tokens(user_query),
+    }
+    remaining = budget.total - sum(tokens.values())
+
+    # Retrieved months first: they ground the answer in the data
+    retrieved = []
+    if index is not None and len(index) and budget.top_k > 0:
+        limit = min(budget.retrieval, remaining)
+        used = 0
+        for context in index.top_contexts(user_query, budget.top_k):
+            cost = count_tokens(context)
+            if used + cost > limit:
+                break
+            retrieved.append(context)
+            used += cost
+        tokens['retrieved'] = used
+        remaining -= used
+
+    turns = _history_lines(history, budget, max(0, min(budget.history, remaining)))
+    tokens['history'] = sum(count_tokens(line) for line in turns)
+
+    history_text = "\n".join(turns)
+    retrieved_text = "\n".join(retrieved)
+    content = (
+        f"LIVE_DATA: {live_context}\n\n"
+        f"RETRIEVED_HISTORY:\n{retrieved_text}\n\n"
+        f"CHAT_LOGS:\n{history_text}\n\n"
+        f"USER_COMMAND: {user_query}"
+    )
+
+    prompt = BuiltPrompt(
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": content},
+        ],
+        tokens=tokens,
+        retrieved=len(retrieved),
+        turns=len(turns),
+    )
+    logger.info(
+        f"Prompt ~{prompt.total_tokens} tokens (budget {budget.total}): "
+        + ", ".join(f"{name} {count}" for name, count in tokens.items())
+        + f"; {prompt.retrieved} months, {prompt.turns} turns"
+    )
+    return prompt
+
+
+if __name__ == '__main__':
+    print("Testing prompt builder...")
+    long_answer = (
+        "[EXECUTIVE SUMMARY] Volatility is elevated relative to the trailing year. "
+        + "Supporting detail on positioning and term structure. " * 60
+    )
+    history = []
+    for i in range(10):
+        history.append({'role': 'user', 'content': f"Question {i} about hedging exposure?"})
+        history.append({'role': 'assistant', 'content': long_answer})
+
+    legacy_text = "".join(
+        f"{'USER' if m['role'] == 'user' else 'OVIP_DAEMON'}: {m['content']}\n" for m in history[-6:]
+    )
+
+    budget = PromptBudget(total=900)
+    prompt = build_prompt("You are OVIP.", "CURRENT_STATE: 2025-11-01 | WTI: $60.00", "Should we hedge?",
+                          history, budget=budget)
+    assert prompt.total_tokens <= budget.total
+    assert "Supporting detail" not in prompt.messages[1]['content'].split("CHAT_LOGS:")[1].split("\n")[1]
+    print(f"  chat memory: {count_tokens(legacy_text)} tokens verbatim (last 6) -> "
+          f"{prompt.tokens['history']} tokens over {prompt.turns} turns; total {prompt.total_tokens}")
+    print("\n✅ Prompt builder tests complete!")
@@ -0,0 +1,296 @@
+"""
+OVIP - Regime Index Module
+Interval index over the regime history: the run-length encoded Crisis_Prob
+segments held in sorted NumPy arrays, so "which regime was the market in on
+date X", "which regimes overlap this range" and "how long since the last
+crisis" are answered with searchsorted in O(log n) instead of rescanning the
+frame. When new months arrive the index is extended with the new rows only.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from modules.regime_detection import REGIMES, REGIME_DTYPE, RegimeDetector, run_starts
+
+logger = logging.getLogger(__name__)
+
+CRISIS = REGIMES.index('CRISIS')
+
+DateLike = Union[str, pd.Timestamp, np.datetime64]
+
+
+def _as_ns(date: DateLike) -> np.int64:
+    return np.int64(pd.Timestamp(date).value)
+
+
+class RegimeIntervalIndex:
+    """Regime segments of a date-ordered frame, indexed by start date"""
+
+    def __init__(self, detector: Optional[RegimeDetector] = None):
+        """
+        Args:
+            detector: Supplies the regime thresholds (defaults to RegimeDetector())
+        """
+        self.detector = detector or RegimeDetector()
+        self._starts = np.empty(0, dtype=np.int64)      # segment start dates (ns)
+        self._ends = np.empty(0, dtype=np.int64)        # last date in the segment (ns)
+        self._codes = np.empty(0, dtype=np.int8)
+        self._offsets = np.empty(0, dtype=np.int64)     # row position of each segment start
+        self._last_crisis = np.empty(0, dtype=np.int64)  # latest crisis segment at or before each one (-1: none)
+        self.n_rows = 0
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, detector: Optional[RegimeDetector] = None) -> 'RegimeIntervalIndex':
+        """Build the index from a frame with Date and Crisis_Prob columns, in date order"""
+        return cls(detector).extend(df)
+
+    # -- building ------------------------------------------------------------
+
+    def extend(self, df: pd.DataFrame) -> 'RegimeIntervalIndex':
+        """
+        Append the rows of df dated after the last indexed date
+
+        df may be the full refreshed frame: rows already indexed are skipped
+        with one searchsorted, and only the new months are classified.
+        """
+        dates = pd.to_datetime(df['Date']).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        first_new = int(np.searchsorted(dates, self._ends[-1], side='right')) if self.n_rows else 0
+        if first_new >= len(dates):
+            return self
+
+        dates = dates[first_new:]
+        codes = self.detector.regime_codes(df['Crisis_Prob'].to_numpy()[first_new:])
+        starts = run_starts(codes)
+        ends = np.append(starts[1:], len(codes)) - 1
+
+        merged = 0
+        if self.n_rows and codes[0] == self._codes[-1]:
+            # The new months continue the current regime: extend the open segment
+            self._ends[-1] = dates[ends[0]]
+            starts, ends, merged = starts[1:], ends[1:], 1
+
+        new_codes = codes[starts].astype(np.int8)
+        previous = self._last_crisis[-1] if self.n_rows else -1
+        positions = np.arange(len(self._codes), len(self._codes) + len(starts))
+        marks = np.concatenate(([previous], np.where(new_codes == CRISIS, positions, -1)))
+        last_crisis = np.maximum.accumulate(marks)[1:]
+
+        self._starts = np.concatenate((self._starts, dates[starts]))
+        self._ends = np.concatenate((self._ends, dates[ends]))
+        self._codes = np.concatenate((self._codes, new_codes))
+        self._offsets = np.concatenate((self._offsets, self.n_rows + starts))
+        self._last_crisis = np.concatenate((self._last_crisis, last_crisis))
+        self.n_rows += len(codes)
+        logger.debug(f"Regime index: +{len(codes)} rows, +{len(starts)} segments ({merged} extended)")
+        return self
+
+    # -- queries -------------------------------------------------------------
+
+    @property
+    def n_segments(self) -> int:
+        return len(self._codes)
+
+    @property
+    def first_date(self) -> Optional[pd.Timestamp]:
+        return pd.Timestamp(self._starts[0]) if self.n_rows else None
+
+    @property
+    def last_date(self) -> Optional[pd.Timestamp]:
+        return pd.Timestamp(self._ends[-1]) if self.n_rows else None
+
+    def segment_at(self, date: DateLike) -> int:
+        """
+        Position of the segment covering a date, or -1 outside the indexed range
+
+        A segment covers its start up to the next segment's start, so dates
+        between two monthly observations belong to the earlier one.
+        """
+        ns = _as_ns(date)
+        if not self.n_rows or ns > self._ends[-1]:
+            return -1
+        return int(np.searchsorted(self._starts, ns, side='right')) - 1
+
+    def regime_at(self, date: DateLike) -> Optional[str]:
+        """Regime label on a date (None outside the indexed range)"""
+        position = self.segment_at(date)
+        return REGIMES[self._codes[position]] if position >= 0 else None
+
+    def segments(
+        self,
+        start: Optional[DateLike] = None,
+        end: Optional[DateLike] = None,
+        regime: Optional[str] = None
+    ) -> pd.DataFrame:
+        """
+        Segments overlapping [start, end]
+
+        Args:
+            start: Range start (defaults to the first indexed date)
+            end: Range end, inclusive (defaults to the last indexed date)
+            regime: Keep only segments of this regime ('CALM', 'MODERATE', 'CRISIS')
+
+        Returns:
+            DataFrame with start, end, regime and duration (rows), as
+            RegimeDetector.regime_segments
+        """
+        # Segments cover start..next start, as in segment_at
+        lo = 0 if start is None else max(int(np.searchsorted(self._starts, _as_ns(start), side='right')) - 1, 0)
+        hi = self.n_segments if end is None else int(np.searchsorted(self._starts, _as_ns(end), side='right'))
+        selected = np.arange(lo, max(hi, lo))
+        if regime is not None:
+            selected = selected[self._codes[selected] == REGIMES.index(regime.upper())]
+        return self._frame(selected)
+
+    def last_crisis(self, date: Optional[DateLike] = None) -> Optional[pd.Series]:
+        """The latest crisis segment starting on or before a date (defaults to the last indexed date)"""
+        position = self.n_segments - 1 if date is None else self.segment_at(date)
+        if position < 0 or self._last_crisis[position] < 0:
+            return None
+        return self._frame(self._last_crisis[position:position + 1]).iloc[0]
+
+    def time_since_last_crisis(self, date: Optional[DateLike] = None) -> Optional[pd.Timedelta]:
+        """
+        Time from the end of the last crisis to a date
+
+        Zero while the market is in a crisis on that date, None if no crisis
+        has occurred yet (or the date is outside the index).
+        """
+        position = self.n_segments - 1 if date is None else self.segment_at(date)
+        if position < 0 or self._last_crisis[position] < 0:
+            return None
+        if self._codes[position] == CRISIS:
+            return pd.Timedelta(0)
+        when = self._ends[-1] if date is None else _as_ns(date)
+        return pd.Timedelta(int(when - self._ends[self._last_crisis[position]]))
+
+    def months_since_last_crisis(self, date: Optional[DateLike] = None) -> Optional[int]:
+        """time_since_last_crisis in calendar months (0 while in a crisis)"""
+        since = self.time_since_last_crisis(date)
+        if since is None or since == pd.Timedelta(0):
+            return None if since is None else 0
+        when = self.last_date if date is None else pd.Timestamp(date)
+        return (when.to_period('M') - (when - since).to_period('M')).n
+
+    def to_frame(self) -> pd.DataFrame:
+        """Every segment, in date order"""
+        return self._frame(np.arange(self.n_segments))
+
+    def _frame(self, positions: np.ndarray) -> pd.DataFrame:
+        positions = np.asarray(positions, dtype=np.int64)
+        next_offsets = np.append(self._offsets[1:], self.n_rows)
+        return pd.DataFrame({
+            'start': self._starts[positions].view('datetime64[ns]'),
+            'end': self._ends[positions].view('datetime64[ns]'),
+            'regime': pd.Categorical.from_codes(self._codes[positions], dtype=REGIME_DTYPE),
+            'duration': next_offsets[positions] - self._offsets[positions],
+        })
+
+
+# Indexes kept per (source, first date, first Crisis_Prob), least recently used evicted first
+MAX_INDEXES = 8
+
+_indexes: 'OrderedDict[tuple, RegimeIntervalIndex]' = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_regime_index(df: pd.DataFrame, source: Optional[Hashable] = None) -> RegimeIntervalIndex:
+    """
+    Shared regime index for the market frame, extended in place when new months arrive
+
+    The process keeps one index per series: frames are told apart by source
+    and by their first row (date and Crisis_Prob), so markets, and a full
+    history versus a date-filtered slice, never evict each other. Within a
+    series, a frame holding the same row at the last indexed date only adds
+    its newer rows; a revised history rebuilds that series' index.
+
+    Args:
+        df: Market data in date order, with Date and Crisis_Prob columns
+        source: Market ID or other identifier of the frame's origin, for
+            series that could share their first row
+    """
+    key = (source, pd.Timestamp(df['Date'].iloc[0]), float(df['Crisis_Prob'].iloc[0])) if len(df) else (source,)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None and len(df) >= index.n_rows and _continues(index, df):
+            index.extend(df)
+        else:
+            index = RegimeIntervalIndex.from_frame(df)
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+        return index
+
+
+def _continues(index: RegimeIntervalIndex, df: pd.DataFrame) -> bool:
+    """Whether df's first index.n_rows rows are the ones the index was built from"""
+    if not index.n_rows:
+        return True
+    last = index.n_rows - 1
+    dates = df['Date']
+    if pd.Timestamp(dates.iloc[0]) != index.first_date or pd.Timestamp(dates.iloc[last]) != index.last_date:
+        return False
+    code = index.detector.regime_codes([df['Crisis_Prob'].iloc[last]])[0]
+    return code == index._codes[-1]
+
+
+if __name__ == '__main__':
+    import time
+
+    print("Testing regime interval index...")
+    rng = np.random.default_rng(11)
+    n_rows = 50_000
+    frame = pd.DataFrame({
+        'Date': pd.date_range('1900-01-01', periods=n_rows, freq='D'),
+        'Crisis_Prob': np.clip(np.cumsum(rng.normal(0, 0.05, n_rows)) % 1.0, 0, 1),
+    })
+    detector = RegimeDetector()
+    expected = detector.regime_segments(frame)
+    index = RegimeIntervalIndex.from_frame(frame)
+    pd.testing.assert_frame_equal(index.to_frame(), expected.astype({'start': 'datetime64[ns]', 'end': 'datetime64[ns]'}))
+
+    # Incremental extension (including a split inside a segment) matches a full build
+    pieces = RegimeIntervalIndex.from_frame(frame.iloc[:1234])
+    pieces.extend(frame.iloc[:30_000]).extend(frame)
+    pd.testing.assert_frame_equal(pieces.to_frame(), index.to_frame())
+
+    labels = detector.detect_regime_shifts(frame)['Regime_Label'].astype(str).to_numpy()
+    probes = rng.integers(0, n_rows, 2000)
+    start = time.perf_counter()
+    found = [index.regime_at(frame['Date'].iat[i]) for i in probes]
+    per_lookup = (time.perf_counter() - start) / len(probes)
+    assert found == list(labels[probes])
+    start = time.perf_counter()
+    for i in probes[:200]:
+        detector.detect_regime_shifts(frame.iloc[:i + 1])['Regime_Label'].iat[-1]
+    per_scan = (time.perf_counter() - start) / 200
+    print(f"  point lookup: {per_lookup * 1e6:.1f}µs (full rescan {per_scan * 1e3:.2f}ms)")
+
+    # Range overlap and time since the last crisis agree with a brute-force scan
+    lo, hi = frame['Date'].iat[10_000], frame['Date'].iat[10_500]
+    overlap = index.segments(lo, hi)
+    brute = expected[(expected['end'] >= lo) & (expected['start'] <= hi)]
+    assert len(overlap) == len(brute)
+    date = frame['Date'].iat[40_000]
+    crises = expected[(expected['regime'] == 'CRISIS') & (expected['start'] <= date)]
+    since = index.time_since_last_crisis(date)
+    in_crisis = index.regime_at(date) == 'CRISIS'
+    assert since == (pd.Timedelta(0) if in_crisis else date - crises['end'].iloc[-1])
+    print(f"  {index.n_segments} segments, {len(overlap)} overlap the probe range, "
+          f"{since} since the last crisis on {date.date()}")
+
+    # Alternating between series (full history, a later slice, another market) reuses each index
+    other = frame.assign(Crisis_Prob=frame['Crisis_Prob'][::-1].to_numpy())
+    frames = {'full': frame.iloc[:40_000], 'slice': frame.iloc[20_000:40_000], 'other': other.iloc[:40_000]}
+    shared = {name: get_regime_index(f) for name, f in frames.items()}
+    assert all(get_regime_index(f) is shared[name] for name, f in frames.items())
+    assert get_regime_index(frame) is shared['full'] and shared['full'].n_rows == n_rows
+    assert get_regime_index(other, source='BRENT') is not shared['other']
+    pd.testing.assert_frame_equal(shared['full'].to_frame(), index.to_frame())
+    print(f"  {len(_indexes)} shared indexes, each extended in place")
+    print("\n✅ Regime index tests complete!")
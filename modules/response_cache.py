@@ -0,0 +1,329 @@
+"""
+OVIP - Response Cache Module
+Reuses AI daemon answers for repeated questions. Entries are scoped to the data
+version and the LIVE_DATA snapshot the answer was generated from, matched first
+on the normalized query and then on TF-IDF similarity of the query text, and
+expire by TTL and LRU. Queries with no content words ("Why?", "How so?") only
+make sense in their conversation and are never cached. Paraphrase matching uses a vectorizer fitted on the
+cached questions' own content words (numbers excluded), not the RAG
+vectorizer, whose vocabulary is the data's numbers plus a few column tags:
+under it every question mentioning "WTI" looks identical. The cache persists to disk so answers survive restarts.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, TfidfVectorizer
+
+from modules.data_cache import default_cache_dir
+
+logger = logging.getLogger(__name__)
+
+# Defaults: answers are reused for a few hours within the same data/snapshot scope
+DEFAULT_TTL = 6 * 3600
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_SIMILARITY = 0.75
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_CONTRACTION = re.compile(r"['’](s|re|ve|ll|d|m)\b")
+
+# Negations change the answer, so they are kept as content words
+_STOP_WORDS = ENGLISH_STOP_WORDS - {'no', 'nor', 'not'}
+
+
+def _content_words(query: str):
+    text = _CONTRACTION.sub("", query.lower().replace("n't", " not").replace("n’t", " not"))
+    return [t for t in _TOKEN_PATTERN.findall(text) if t not in _STOP_WORDS]
+
+
+def normalize_query(query: str) -> str:
+    """
+    Lowercased content words in their original order
+
+    Filler-word rephrasings share a key, reordered questions ("WTI above
+    Brent" / "Brent above WTI") do not.
+    """
+    return " ".join(_content_words(query))
+
+
+def query_terms(query: str):
+    """Content words that carry the meaning of a question (numbers excluded), for paraphrase matching"""
+    return sorted(set(t for t in _content_words(query) if not t[0].isdigit()))
+
+
+def _same_order(a: str, b: str) -> bool:
+    """Whether the content words two queries share appear in the same order in both"""
+    words_a, words_b = list(dict.fromkeys(_content_words(a))), list(dict.fromkeys(_content_words(b)))
+    shared = set(words_a) & set(words_b)
+    return [w for w in words_a if w in shared] == [w for w in words_b if w in shared]
+
+
+def scope_key(*parts: str) -> str:
+    """Short hash identifying the data version and live snapshot behind an answer"""
+    return hashlib.sha1("\x1f".join(parts).encode()).hexdigest()[:16]
+
+
+@dataclass
+class CachedResponse:
+    query: str
+    normalized: str
+    scope: str
+    response: str
+    created: float
+
+
+class ResponseCache:
+    """Thread-safe TTL + LRU cache of AI responses with near-duplicate lookup"""
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        similarity_threshold: float = DEFAULT_SIMILARITY
+    ):
+        """
+        Args:
+            path: JSON file the cache persists to (None = memory only)
+            ttl: Seconds an answer stays valid
+            max_entries: Entries kept before least-recently-used eviction
+            similarity_threshold: Minimum cosine similarity for a paraphrase hit
+        """
+        self.path = Path(path) if path else None
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+
+        self._entries: 'OrderedDict[str, CachedResponse]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {'exact_hits': 0, 'similar_hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+        if self.path is not None:
+            self._load()
+
+    @staticmethod
+    def _key(normalized: str, scope: str) -> str:
+        return f"{scope}:{normalized}"
+
+    def _expired(self, entry: CachedResponse, now: float) -> bool:
+        return now - entry.created > self.ttl
+
+    def get(self, query: str, scope: str, match_similar: bool = True) -> Optional[str]:
+        """
+        Cached answer for a query within a scope
+
+        Args:
+            query: Raw user query
+            scope: Key from scope_key() for the current data and snapshot
+            match_similar: Also return answers to paraphrased questions;
+                otherwise only normalized-query matches are returned
+
+        Returns:
+            Cached response text, or None on a miss (always for queries
+            without content words)
+        """
+        normalized = normalize_query(query)
+        if not normalized:
+            with self._lock:
+                self.metrics['misses'] += 1
+            return None
+        now = time.time()
+
+        with self._lock:
+            key = self._key(normalized, scope)
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                self.metrics['expired'] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.metrics['exact_hits'] += 1
+                return entry.response
+
+            candidates = [
+                (k, e) for k, e in self._entries.items()
+                if e.scope == scope and not self._expired(e, now)
+            ]
+
+        match = self._most_similar(query, candidates) if match_similar else None
+
+        with self._lock:
+            if match is None or match not in self._entries:
+                self.metrics['misses'] += 1
+                return None
+            self._entries.move_to_end(match)
+            self.metrics['similar_hits'] += 1
+            return self._entries[match].response
+
+    def _most_similar(self, query: str, candidates) -> Optional[str]:
+        if not candidates or not query_terms(query):
+            return None
+
+        # IDF over the cached questions themselves, so shared generic terms weigh little
+        vectorizer = TfidfVectorizer(analyzer=query_terms)
+        try:
+            vectors = vectorizer.fit_transform([query] + [e.query for _, e in candidates])
+        except ValueError:
+            # No content words in any of the questions
+            return None
+        query_vec, stored = vectors[0], vectors[1:]
+
+        # TF-IDF rows are L2-normalized, so the dot product is the cosine similarity;
+        # the bag of words ignores order, so reordered questions are rejected separately
+        similarity = np.asarray((stored @ query_vec.T).todense()).ravel()
+        for best in np.argsort(similarity)[::-1]:
+            if similarity[best] < self.similarity_threshold:
+                return None
+            if _same_order(query, candidates[best][1].query):
+                return candidates[best][0]
+        return None
+
+    def put(self, query: str, scope: str, response: str):
+        """Store an answer and persist the cache (queries without content words are skipped)"""
+        entry = CachedResponse(query, normalize_query(query), scope, response, time.time())
+        if not entry.normalized:
+            return
+        with self._lock:
+            key = self._key(entry.normalized, scope)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.metrics['evictions'] += 1
+        self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self._save()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters plus the current size and overall hit rate"""
+        with self._lock:
+            stats = dict(self.metrics, entries=len(self._entries))
+        lookups = stats['exact_hits'] + stats['similar_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['exact_hits'] + stats['similar_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                records = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable response cache {self.path}: {e}")
+            return
+
+        now = time.time()
+        for record in records[-self.max_entries:]:
+            entry = CachedResponse(**record)
+            if not self._expired(entry, now):
+                self._entries[self._key(entry.normalized, entry.scope)] = entry
+        logger.info(f"Loaded {len(self._entries)} cached responses from {self.path}")
+
+    def _save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            records = [asdict(e) for e in self._entries.values()]
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix='.tmp-', suffix='.json')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(records, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not persist response cache: {e}")
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide cache persisted under the shared cache directory"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(default_cache_dir() / 'responses.json')
+    return _cache
+
+
+if __name__ == '__main__':
+    import sys
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+    print("Testing response cache...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'responses.json'
+        cache = ResponseCache(path)
+        scope = scope_key('v1', 'CURRENT_STATE: 2025-11-01 | WTI: $60.00')
+
+        assert cache.get("What's the current threat level?", scope) is None
+        cache.put("What's the current threat level?", scope, "[MARKET THREAT LEVEL] MODERATE")
+
+        assert cache.get("what is the current threat level", scope) is not None
+        assert normalize_query("Shouldn't we hedge?") != normalize_query("Should we hedge?")
+        assert cache.get("Current threat level today", scope) is not None
+        assert cache.get("Current threat level today", scope, match_similar=False) is None
+        assert cache.get("Should we hedge?", scope) is None
+        assert cache.get("What's the current threat level?", scope_key('v2', 'other')) is None
+
+        restarted = ResponseCache(path)
+        assert restarted.get("what's the current threat level", scope) == "[MARKET THREAT LEVEL] MODERATE"
+
+        # Context-only follow-ups are never cached, and word order is part of the key
+        cache.put("Why?", scope, "answer A")
+        assert cache.get("What about that?", scope) is None and cache.get("Why?", scope) is None
+        cache.put("Is WTI above Brent?", scope, "[EXECUTIVE SUMMARY] yes")
+        assert cache.get("Brent above WTI?", scope) is None
+        assert cache.get("Is WTI above Brent now?", scope) == "[EXECUTIVE SUMMARY] yes"
+
+        expired = ResponseCache(path, ttl=0)
+        assert expired.get("what's the current threat level", scope) is None
+        print(f"  {cache.stats()}")
+
+    # Different WTI questions must not collide on the real data. Under the RAG
+    # vectorizer (numbers and column tags only) they are identical.
+    from modules.ai_engine import response_scope, setup_rag_vector_db
+    from modules.data_loader import get_data_loader
+
+    df = get_data_loader().merge_all_data()
+    rag_index, rag_df = setup_rag_vector_db(df)
+    rag_vectorizer = rag_index.vectorizer
+    outlook = "What is the WTI price outlook for next quarter?"
+    hormuz = "Should we short WTI if Iran closes Hormuz?"
+    rag_vectors = rag_vectorizer.transform([outlook, hormuz])
+    print(f"  RAG-vectorizer similarity of two WTI questions: {(rag_vectors[0] @ rag_vectors[1].T).toarray()[0, 0]:.2f}")
+
+    cache = ResponseCache()
+    start = time.perf_counter()
+    scope = response_scope(rag_index, rag_df)
+    print(f"  response scope per message: {(time.perf_counter() - start) * 1e3:.2f}ms (no frame hashing)")
+    cache.put(outlook, scope, "[EXECUTIVE SUMMARY] outlook")
+    assert cache.get(hormuz, scope) is None
+    assert cache.get("WTI price outlook for the coming quarter", scope) == "[EXECUTIVE SUMMARY] outlook"
+    assert cache.stats()['similar_hits'] == 1
+    print("  distinct WTI questions miss, the paraphrase hits")
+
+    # The conversation is part of the scope: the same words after different turns do not share an answer
+    greeting = {'role': 'assistant', 'content': 'OVIP_DAEMON ONLINE. AWAITING QUERY...'}
+    after_hormuz = [greeting, {'role': 'user', 'content': hormuz}, {'role': 'assistant', 'content': '[EXECUTIVE SUMMARY] no'}]
+    assert response_scope(rag_index, rag_df, outlook, [greeting]) == response_scope(rag_index, rag_df, outlook, [greeting, {'role': 'user', 'content': outlook}])
+    assert response_scope(rag_index, rag_df, outlook, [greeting]) != response_scope(rag_index, rag_df, outlook, after_hormuz)
+
+    print("\n✅ Response cache tests complete!")
@@ -0,0 +1,37 @@
+"""
+OVIP - Settings Module
+Secret lookup for the headless core: environment variables first, then any
+registered secret sources (the Streamlit adapter registers st.secrets).
+"""
+
+import os
+import logging
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_secret_sources: List[Callable[[str], Optional[str]]] = []
+
+
+def register_secret_source(source: Callable[[str], Optional[str]]) -> None:
+    """Add a callable name -> value (or None) consulted after the environment"""
+    if source not in _secret_sources:
+        _secret_sources.append(source)
+
+
+def get_secret(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Look up a secret by name, returning default when no source has it"""
+    value = os.environ.get(name)
+    if value:
+        return value
+
+    for source in _secret_sources:
+        try:
+            value = source(name)
+        except Exception as e:
+            logger.debug(f"Secret source failed for {name}: {e}")
+            continue
+        if value:
+            return value
+
+    return default
@@ -0,0 +1,134 @@
+"""
+OVIP - Market Snapshot Module
+Builds the "latest state" shown on the Dashboard and Reports pages once per data
+version (and model version, for the predictions) and shares it across every page
+and session in the process. Each market has its own snapshot, so the headline
+numbers and predictions always describe the market the page is showing.
+"""
+
+import logging
+from dataclasses import dataclass, field, replace
+from typing import Dict, Optional
+
+import pandas as pd
+
+from modules.caching import memoize
+from modules.market_store import DEFAULT_MARKET, MARKET_COLUMN
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MarketSnapshot:
+    """Immutable view of the latest observation and model outputs"""
+    data_version: str
+    date: pd.Timestamp
+    price: float
+    price_change: float
+    volatility: float
+    crisis_prob: float
+    regime: str
+    sentiment: float
+    market: str = DEFAULT_MARKET
+    direction: Dict = field(default_factory=dict)
+    level: Dict = field(default_factory=dict)
+
+    def as_metrics(self) -> Dict:
+        """Dict in the shape returned by DataLoader.get_latest_metrics"""
+        return {
+            'price': self.price,
+            'price_change': self.price_change,
+            'volatility': self.volatility,
+            'crisis_prob': self.crisis_prob,
+            'regime': self.regime,
+            'sentiment': self.sentiment,
+        }
+
+
+def _latest_predictions(df: pd.DataFrame, models_dir) -> Dict[str, Dict]:
+    """Direction and level predictions for the last row of the dataset"""
+    from modules.feature_engineering import FeatureEngineer
+    from modules.models import load_models_from_dir
+
+    engineer = FeatureEngineer()
+    features = engineer.create_all_features(df)
+    predictor = load_models_from_dir(models_dir)
+    return {
+        'direction': predictor.predict_direction(features),
+        'level': predictor.predict_level(features),
+    }
+
+
+def _market_frame(loader, market: str) -> pd.DataFrame:
+    if market == DEFAULT_MARKET:
+        return loader.merge_all_data()
+    return loader.load(market).drop(columns=MARKET_COLUMN)
+
+
+@memoize(key=lambda loader, market: (str(loader.data_dir), market, loader.markets.data_version(market)))
+def _market_state(loader, market: str) -> MarketSnapshot:
+    df = _market_frame(loader, market)
+    if len(df) < 2:
+        raise ValueError("Need at least two observations to build a snapshot")
+
+    # Only the last two rows are needed for the headline numbers
+    latest, previous = df.iloc[-1], df.iloc[-2]
+    crisis_prob = float(latest['Crisis_Prob'])
+
+    # Determine Regime State dynamically
+    regime_str = "CRISIS" if crisis_prob > 0.5 else "MODERATE" if crisis_prob > 0.1 else "CALM"
+
+    return MarketSnapshot(
+        data_version=loader.markets.data_version(market),
+        date=latest['Date'],
+        price=float(latest['WTI']),
+        price_change=float((latest['WTI'] - previous['WTI']) / previous['WTI'] * 100),
+        volatility=float(latest['Volatility']),
+        crisis_prob=crisis_prob,
+        regime=regime_str,
+        sentiment=float(latest.get('Score', 0)),
+        market=market,
+    )
+
+
+# Keyed on the model artifacts too, so a ModelStore swap or retrain invalidates it;
+# a failed prediction raises and is therefore never memoized
+@memoize(key=lambda loader, market, models_version: (
+    str(loader.data_dir), market, loader.markets.data_version(market), models_version))
+def _predictions(loader, market: str, models_version: str) -> Dict[str, Dict]:
+    return _latest_predictions(_market_frame(loader, market), loader.data_dir)
+
+
+def _build_snapshot(loader, market: str) -> MarketSnapshot:
+    from modules.model_registry import get_model_registry
+
+    state = _market_state(loader, market)
+    try:
+        models_version = get_model_registry(loader.data_dir).store.models_version
+        return replace(state, **_predictions(loader, market, models_version))
+    except Exception as e:
+        # Serve the headline numbers without predictions; the next call retries
+        logger.error(f"{market} snapshot predictions failed: {e}")
+        return state
+
+
+def get_latest_snapshot(loader=None, market: str = DEFAULT_MARKET) -> Optional[MarketSnapshot]:
+    """
+    Latest market snapshot, rebuilt only when the underlying data or models change
+
+    Args:
+        loader: DataLoader to read from (defaults to get_data_loader())
+        market: Market ID ('WTI', 'BRENT', ...)
+
+    Returns:
+        MarketSnapshot, or None if the data could not be loaded
+    """
+    if loader is None:
+        from modules.data_loader import get_data_loader
+        loader = get_data_loader()
+
+    try:
+        return _build_snapshot(loader, market.upper())
+    except Exception as e:
+        logger.error(f"{market} snapshot unavailable: {e}")
+        return None
@@ -0,0 +1,60 @@
+"""
+OVIP - Streamlit Adapter
+Thin UI layer over the headless core: wires st.secrets into the secret lookup
+and surfaces data-layer failures on the page. Only the Streamlit pages import
+this module; batch jobs use modules.data_loader & co. directly.
+"""
+
+import streamlit as st
+
+from modules.data_loader import get_data_loader
+from modules.market_store import DEFAULT_MARKET, MARKET_COLUMN, market_from_display
+from modules.settings import register_secret_source
+
+
+def _streamlit_secret(name):
+    return st.secrets.get(name)
+
+
+register_secret_source(_streamlit_secret)
+
+
+def selected_market():
+    """Market picked in the Country Selector (session market_display); WTI if it has no data."""
+    market = market_from_display(st.session_state.get('market_display'))
+    return market if market in get_data_loader().markets.markets() else DEFAULT_MARKET
+
+
+def load_merged_data():
+    """
+    Merged dataset for a page, showing the loader error in the UI on failure.
+
+    Reads the selected_market() from the market store.
+    """
+    loader = get_data_loader()
+    market = selected_market()
+    if market != DEFAULT_MARKET:
+        try:
+            return loader.load(market).drop(columns=MARKET_COLUMN)
+        except Exception as e:
+            st.warning(f"{market} data unavailable ({e}), showing {DEFAULT_MARKET}")
+    df = loader.merge_all_data()
+    if df.empty and loader.last_error is not None:
+        st.error(f"Data Loader Error: {loader.last_error}")
+    return df
+
+
+def stream_markdown(tokens, render=lambda text: text):
+    """
+    Render a token stream into one placeholder as the tokens arrive.
+
+    render maps the text so far to the (HTML) markdown shown, so each terminal
+    keeps its own styling. Returns the full text once the stream ends.
+    """
+    placeholder = st.empty()
+    text = ""
+    for token in tokens:
+        text += token
+        placeholder.markdown(render(text + "▌"), unsafe_allow_html=True)
+    placeholder.markdown(render(text), unsafe_allow_html=True)
+    return text
@@ -196,9 +196,15 @@ def create_performance_chart(
 
 def create_regime_timeline(
     df: pd.DataFrame,
-    title: str = "Regime State Timeline"
+    title: str = "Regime State Timeline",
+    regime_index=None
 ) -> go.Figure:
-    """Create timeline showing regime probability states"""
+    """Create timeline showing regime probability states, with crisis spells shaded
+
+    regime_index is a RegimeIntervalIndex over the full history (defaults to
+    the shared index when df has Crisis_Prob); only the spells overlapping the
+    plotted dates are looked up.
+    """
     regime_col = 'Crisis_Prob' if 'Crisis_Prob' in df.columns else 'L_Regime'
     
     if regime_col not in df.columns:
@@ -207,6 +213,15 @@ def create_regime_timeline(
     
     fig = go.Figure()
     
+    if regime_index is None and regime_col == 'Crisis_Prob' and len(df):
+        from modules.regime_index import get_regime_index
+        regime_index = get_regime_index(df)
+    if regime_index is not None and len(df):
+        crises = regime_index.segments(df['Date'].min(), df['Date'].max(), regime='CRISIS')
+        for spell in crises.itertuples(index=False):
+            fig.add_vrect(x0=spell.start, x1=spell.end, fillcolor=COLORS['danger'],
+                          opacity=0.15, line_width=0, layer='below')
+    
     fig.add_trace(go.Scatter(
         x=df['Date'], y=df[regime_col], fill='tozeroy',
         line=dict(color=COLORS['warning'], width=2),
@@ -6,7 +6,9 @@ from datetime import datetime
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import config
 from modules.data_loader import get_data_loader
-from modules.ai_engine import setup_rag_vector_db, get_ai_response
+from modules.snapshot import get_latest_snapshot
+from modules.streamlit_adapter import load_merged_data, selected_market, stream_markdown
+from modules.ai_engine import setup_rag_vector_db, stream_ai_response
 
 st.set_page_config(page_title="OVIP // COMMAND_CENTER", layout="wide", initial_sidebar_state="collapsed")
 config.apply_custom_theme()
@@ -20,12 +22,13 @@ if 'booted' not in st.session_state:
     boot_box.empty()
     st.session_state['booted'] = True
 
-# 2. Data Loading
+# 2. Data Loading (charts, metrics and model signal all follow the selected market)
 loader = get_data_loader()
-df_main = loader.merge_all_data()
-metrics = loader.get_latest_metrics()
+market_id = selected_market()
+df_main = load_merged_data()
+snapshot = get_latest_snapshot(loader, market_id)
 
-if df_main.empty or metrics is None:
+if df_main.empty or snapshot is None:
     st.error(">>> FATAL_ERROR: /data/ payload missing. Connection terminated.")
     st.stop()
 
@@ -36,8 +39,9 @@ st.markdown(f"<p style='color: #008F11;'>SESSION_ACTIVE // TIMESTAMP: {datetime.
 st.markdown("<hr style='border: 1px dashed #00FF41;'>", unsafe_allow_html=True)
 
 # 4. Top Metrics Row
+metrics = snapshot.as_metrics()
 c1, c2, c3, c4 = st.columns(4)
-c1.metric("WTI_PRICE_INDEX", f"${metrics['price']:.2f}", f"{metrics['price_change']:+.2f}%")
+c1.metric(f"{market_id}_PRICE_INDEX", f"${metrics['price']:.2f}", f"{metrics['price_change']:+.2f}%")
 c2.metric("VOLATILITY_SIGMA", f"{metrics['volatility']:.3f}", "STABLE")
 
 regime_color = "#FF003C" if "CRISIS" in metrics['regime'] else "#00FF41"
@@ -49,7 +53,12 @@ c3.markdown(f"""
 </div>
 """, unsafe_allow_html=True)
 
-c4.metric("NPRS-1_SIGNAL_OVERRIDE", "▲ UP (HEDGE)", "CONF_INTERVAL: 69.1%")
+signal = snapshot.direction
+if signal.get('direction') in ('UP', 'DOWN'):
+    label = "▲ UP (HEDGE)" if signal['direction'] == 'UP' else "▼ DOWN (HOLD)"
+    c4.metric("NPRS-1_SIGNAL_OVERRIDE", label, f"CONF_INTERVAL: {signal['confidence']:.1%}")
+else:
+    c4.metric("NPRS-1_SIGNAL_OVERRIDE", "OFFLINE", "MODEL_UNAVAILABLE", delta_color="off")
 
 st.markdown("<br>", unsafe_allow_html=True)
 
@@ -92,22 +101,26 @@ with col_side:
     """)
     
     st.markdown("### > SECURE_AI_TERMINAL")
-    vec, tfidf, rag_df = setup_rag_vector_db(df_main)
+    rag_index, rag_df = setup_rag_vector_db(df_main)
     
     if "chat" not in st.session_state:
         st.session_state.chat = [{"role": "assistant", "content": "OVIP_DAEMON ONLINE. AWAITING QUERY..."}]
         
+    def terminal_line(role, content):
+        user_color = "#008F11" if role == 'user' else "#00FF41"
+        sender = "root@user" if role == 'user' else "system@ovip"
+        return f"<p style='color: {user_color}; margin: 0;'><b>{sender}:~$</b> {content}</p>"
+
     for msg in st.session_state.chat:
-        user_color = "#008F11" if msg['role'] == 'user' else "#00FF41"
-        sender = "root@user" if msg['role'] == 'user' else "system@ovip"
-        st.markdown(f"<p style='color: {user_color}; margin: 0;'><b>{sender}:~$</b> {msg['content']}</p>", unsafe_allow_html=True)
+        st.markdown(terminal_line(msg['role'], msg['content']), unsafe_allow_html=True)
 
+    # Answer in the same run, streaming tokens into the terminal as they arrive
+    # (dashboard lane: served ahead of the AI Assistant page's chat traffic)
     if prompt := st.chat_input("> EXECUTE COMMAND..."):
         st.session_state.chat.append({"role": "user", "content": prompt})
-        st.rerun()
-        
-    if st.session_state.chat[-1]["role"] == "user":
-        with st.spinner("PROCESSING_QUERY..."):
-            ans = get_ai_response(st.session_state.chat[-1]["content"], vec, tfidf, rag_df)
-            st.session_state.chat.append({"role": "assistant", "content": ans})
-            st.rerun()
+        st.markdown(terminal_line('user', prompt), unsafe_allow_html=True)
+        ans = stream_markdown(
+            stream_ai_response(prompt, rag_index, rag_df, history=st.session_state.chat, priority='dashboard'),
+            lambda text: terminal_line('assistant', text)
+        )
+        st.session_state.chat.append({"role": "assistant", "content": ans})
@@ -8,8 +8,8 @@ if str(root_path) not in sys.path:
     sys.path.append(str(root_path))
 
 import config
-from modules.data_loader import get_data_loader
-from modules.ai_engine import setup_rag_vector_db, get_ai_response
+from modules.streamlit_adapter import load_merged_data, stream_markdown
+from modules.ai_engine import setup_rag_vector_db, stream_ai_response
 
 # 1. Page Configuration
 st.set_page_config(page_title="OVIP - Intelligence Terminal", layout="wide")
@@ -22,11 +22,10 @@ st.markdown("<h2>💬 INTELLIGENCE TERMINAL</h2><hr style='border: 1px solid #1E
 @st.cache_resource
 def initialize_rag():
     """Caches the heavy vector DB setup so it doesn't reload on every click"""
-    df = get_data_loader().merge_all_data()
-    vec, tfidf, rag_df = setup_rag_vector_db(df)
-    return vec, tfidf, rag_df
+    df = load_merged_data()
+    return setup_rag_vector_db(df)
 
-vec, tfidf, rag_df = initialize_rag()
+rag_index, rag_df = initialize_rag()
 
 # 4. Session State Initialization
 if "chat_history" not in st.session_state:
@@ -35,28 +34,28 @@ if "chat_history" not in st.session_state:
     ]
 
 # 5. Display History
-for msg in st.session_state.chat_history:
-    bg_color = config.COLORS['surface'] if msg['role'] == 'user' else "rgba(100, 255, 218, 0.05)"
-    border_color = "#8892B0" if msg['role'] == 'user' else config.COLORS['accent_primary']
-    st.markdown(f"""
+def chat_bubble(role, content):
+    bg_color = config.COLORS['surface'] if role == 'user' else "rgba(100, 255, 218, 0.05)"
+    border_color = "#8892B0" if role == 'user' else config.COLORS['accent_primary']
+    return f"""
     <div style='background: {bg_color}; padding: 15px; border-radius: 5px; border-left: 3px solid {border_color}; margin-bottom: 10px;'>
-        <strong style='color:{config.COLORS['accent_primary']};'>{'YOU' if msg['role'] == 'user' else 'OVIP AI'}:</strong><br>
-        <span style='color: #CCD6F6;'>{msg['content']}</span>
+        <strong style='color:{config.COLORS['accent_primary']};'>{'YOU' if role == 'user' else 'OVIP AI'}:</strong><br>
+        <span style='color: #CCD6F6;'>{content}</span>
     </div>
-    """, unsafe_allow_html=True)
+    """
+
+for msg in st.session_state.chat_history:
+    st.markdown(chat_bubble(msg['role'], msg['content']), unsafe_allow_html=True)
 
 # 6. Combined Chat Logic (The Fix)
 if prompt := st.chat_input("Enter command..."):
-    # Step A: Append User Message
+    # Step A: Append and show the User Message
     st.session_state.chat_history.append({"role": "user", "content": prompt})
+    st.markdown(chat_bubble('user', prompt), unsafe_allow_html=True)
     
-    # Step B: Generate AI Response in the SAME run
-    with st.spinner("Processing Intelligence Report..."):
-        try:
-            ans = get_ai_response(prompt, vec, tfidf, rag_df)
-            st.session_state.chat_history.append({"role": "assistant", "content": ans})
-        except Exception as e:
-            st.error(f"Engine Error: {str(e)}")
-    
-    # Step C: Rerun ONCE to show the final state
-    st.rerun()
+    # Step B: Stream the AI Response in the SAME run (no spinner, no rerun)
+    ans = stream_markdown(
+        stream_ai_response(prompt, rag_index, rag_df, history=st.session_state.chat_history),
+        lambda text: chat_bubble('assistant', text)
+    )
+    st.session_state.chat_history.append({"role": "assistant", "content": ans})
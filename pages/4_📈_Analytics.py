@@ -5,14 +5,14 @@ from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 import config
-from modules.data_loader import get_data_loader
+from modules.streamlit_adapter import load_merged_data
 
 st.set_page_config(page_title="OVIP - Analytics", layout="wide")
 config.apply_custom_theme()
 
 st.markdown("<h2>📈 MULTI-VARIATE ANALYTICS</h2><hr style='border: 1px solid #1E3A5F;'>", unsafe_allow_html=True)
 
-df = get_data_loader().merge_all_data()
+df = load_merged_data()
 
 c1, c2 = st.columns(2)
 
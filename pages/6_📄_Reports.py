@@ -6,28 +6,67 @@ from datetime import datetime
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 import config
 from modules.data_loader import get_data_loader
+from modules.regime_index import get_regime_index
+from modules.snapshot import get_latest_snapshot
+from modules.streamlit_adapter import load_merged_data, selected_market
 
 st.set_page_config(page_title="OVIP - Reports", layout="wide")
 config.apply_custom_theme()
 
 st.markdown("<h2>📄 INTELLIGENCE EXPORT</h2><hr style='border: 1px solid #1E3A5F;'>", unsafe_allow_html=True)
 
-metrics = get_data_loader().get_latest_metrics()
+# Telemetry and model signal for the market picked in the Country Selector
+loader = get_data_loader()
+market_id = selected_market()
+snapshot = get_latest_snapshot(loader, market_id)
+if snapshot is None:
+    st.error(f"{market_id} snapshot unavailable: /data/ payload missing.")
+    st.stop()
+metrics = snapshot.as_metrics()
+
+# Regime history from the shared regime index (O(log n) lookups, no frame rescan)
+df = load_merged_data()
+regime_history = "* **Regime History:** unavailable"
+if {'Date', 'Crisis_Prob'}.issubset(df.columns) and len(df):
+    regime_index = get_regime_index(df, source=market_id)
+    crisis = regime_index.last_crisis()
+    crisis_count = len(regime_index.segments(regime='CRISIS'))
+    regime_history = (
+        f"* **Last Crisis:** {crisis['start'].strftime('%b %Y')} – {crisis['end'].strftime('%b %Y')} "
+        f"({regime_index.months_since_last_crisis()} months ago)\n"
+        f"* **Crisis Spells on Record:** {crisis_count} since {regime_index.first_date.strftime('%Y')}"
+    ) if crisis is not None else "* **Last Crisis:** none on record"
+
+signal, level = snapshot.direction, snapshot.level
+if signal.get('direction') in ('UP', 'DOWN'):
+    hedge = signal['direction'] == 'UP'
+    directives = (
+        f"* **NPRS-1 Signal:** {signal['direction']} ({'Hedge required' if hedge else 'No hedge required'})\n"
+        f"* **Confidence:** {signal['confidence']:.1%}\n"
+    )
+    if level:
+        directives += (
+            f"* **RF-11 Volatility Forecast:** {level['forecast']:.3f} "
+            f"(range {level['range_low']:.3f}–{level['range_high']:.3f}, {level['confidence_level']} confidence)\n"
+        )
+    directives += ("* **Recommendation:** Execute phased hedging protocol for 40-60% of Q2 exposure." if hedge
+                   else "* **Recommendation:** Hold current hedge ratios; re-evaluate at the next monthly print.")
+else:
+    directives = "* **NPRS-1 Signal:** unavailable (model outputs could not be computed)"
 
 report_content = f"""# OVIP EXECUTIVE BRIEFING
 **Generated:** {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}
-**Target Asset:** {st.session_state.get('market_display', 'WTI (USA)')}
+**Target Asset:** {market_id}
 
 ## CURRENT TELEMETRY
 * **Price:** ${metrics['price']:.2f}
 * **Volatility:** {metrics['volatility']:.3f}
 * **Regime State:** {metrics['regime']} (Crisis Probability: {metrics['crisis_prob']:.2f})
 * **NLP Sentiment:** {metrics['sentiment']:.2f}
+{regime_history}
 
 ## MODEL DIRECTIVES
-* **NPRS-1 Signal:** UP (Hedge required)
-* **Confidence:** 68.2%
-* **Recommendation:** Execute phased hedging protocol for 40-60% of Q2 exposure.
+{directives}
 """
 
 c1, c2 = st.columns([2, 1])
@@ -6,7 +6,8 @@ from datetime import datetime
 import os
 
 # Ensure the AI module is accessible
-from modules.ai_engine import setup_rag_vector_db, get_ai_response
+from modules.streamlit_adapter import stream_markdown  # also registers st.secrets for the headless core
+from modules.ai_engine import setup_rag_vector_db, stream_ai_response
 
 # ==========================================
 # 1. CORE CONFIGURATION & THEME
@@ -120,7 +121,7 @@ def load_data():
         return pd.DataFrame({'Date': pd.date_range(start='1/1/2024', periods=100), 'WTI': 75.0, 'Volatility': 0.15, 'Crisis_Prob': 0.0})
 
 df_main = load_data()
-vec, tfidf, rag_df = setup_rag_vector_db(df_main)
+rag_index, rag_df = setup_rag_vector_db(df_main)
 
 # ==========================================
 # 4. VIEW 1: THE 3D SATELLITE GLOBE
@@ -219,17 +220,16 @@ def render_dashboard():
                     sender = "root@user" if msg['role'] == 'user' else "system@ovip"
                     st.markdown(f"<p style='color: {color};'><b>{sender}:~$</b> {msg['content']}</p>", unsafe_allow_html=True)
             
-            # Chat Input Form
+            # Chat Input Form: answer in the same run, streaming tokens into the chat box as they arrive
             if prompt := st.chat_input("> ENTER_COMMAND_STRING..."):
                 st.session_state.chat.append({"role": "user", "content": prompt})
-                st.rerun()
-
-            # Process AI response seamlessly
-            if st.session_state.chat[-1]["role"] == "user":
-                with st.spinner("PROCESSING_INTELLIGENCE_ROUTINE..."):
-                    ans = get_ai_response(st.session_state.chat[-1]["content"], vec, tfidf, rag_df)
-                    st.session_state.chat.append({"role": "assistant", "content": ans})
-                    st.rerun()
+                with chat_container:
+                    st.markdown(f"<p style='color: {COLORS['cyan']};'><b>root@user:~$</b> {prompt}</p>", unsafe_allow_html=True)
+                    ans = stream_markdown(
+                        stream_ai_response(prompt, rag_index, rag_df, history=st.session_state.chat),
+                        lambda text: f"<p style='color: {COLORS['matrix']};'><b>system@ovip:~$</b> {text}</p>"
+                    )
+                st.session_state.chat.append({"role": "assistant", "content": ans})
 
 # ==========================================
 # 6. APP ROUTER